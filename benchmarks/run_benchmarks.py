@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of PlotData                              #
+# Benchmark suite on synthetic data                        #
+############################################################
+# Generates synthetic tracks, DEM, GPS and an earthquake catalog (served by a local FDSN stand-in)
+# and times every prepare and plot stage separately. Results are written as JSON for comparisons
+# across commits and scene sizes. Stages that need a missing dependency are reported as failed.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import traceback
+import subprocess
+import contextlib
+
+EXAMPLE = """example:
+  python benchmarks/run_benchmarks.py
+  python benchmarks/run_benchmarks.py --size medium --output benchmark_medium.json
+  python benchmarks/run_benchmarks.py --length 3000 --width 3000 --num-dates 150 --repeat 3
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR + '/src', REPO_DIR + '/src/cli', os.path.dirname(os.path.abspath(__file__))]
+
+from synthetic_data import SIZES, TRACKS, write_synthetic_data, get_events, start_fdsn_server, get_plot_box, get_date_list
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Time the PlotData stages on synthetic data',
+                                     epilog=EXAMPLE, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--size', dest='size', choices=list(SIZES), default='small', help='scene size preset (Default: small)')
+    parser.add_argument('--length', dest='length', type=int, default=None, help='number of rows (overrides --size)')
+    parser.add_argument('--width', dest='width', type=int, default=None, help='number of columns (overrides --size)')
+    parser.add_argument('--num-dates', dest='num_dates', type=int, default=None, help='number of dates (overrides --size)')
+    parser.add_argument('--num-stations', dest='num_stations', type=int, default=None, help='number of GPS stations (overrides --size)')
+    parser.add_argument('--num-events', dest='num_events', type=int, default=None, help='number of earthquakes (overrides --size)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=1, help='runs of each warm stage, the fastest counts (Default: 1)')
+    parser.add_argument('--work-dir', dest='work_dir', default=None, help='directory for the synthetic data (Default: temporary)')
+    parser.add_argument('--keep', dest='keep', action='store_true', default=False, help='keep the synthetic data')
+    parser.add_argument('--output', dest='output', default=None, help='JSON results (Default: benchmark_SIZE.json)')
+    parser.add_argument('--verbose', dest='verbose', action='store_true', default=False, help='show the output of the stages')
+    return parser
+
+class StageTimer:
+    """ Runs and times stages, keeps results by stage name """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.results = {}
+
+    def run(self, name, function, *args, repeat=1, **kwargs):
+        ''' fastest of repeat runs of function, returns its value (None if it failed) '''
+        value = None
+        times = []
+        try:
+            for i in range(repeat):
+                with contextlib.ExitStack() as stack:
+                    if not self.verbose:
+                        stack.enter_context(contextlib.redirect_stdout(open(os.devnull, 'w')))
+                    start = time.perf_counter()
+                    value = function(*args, **kwargs)
+                    times.append(time.perf_counter() - start)
+            self.results[name] = {'seconds': round(min(times), 4), 'status': 'ok'}
+        except Exception as error:
+            if self.verbose:
+                traceback.print_exc()
+            self.results[name] = {'seconds': None, 'status': 'failed: ' + type(error).__name__ + ': ' + str(error)[:200]}
+            value = None
+        result = self.results[name]
+        print(f"{name:28s} {result['seconds'] if result['seconds'] is not None else '-':>10} {result['status']}")
+        return value
+
+def get_inps(paths, plot_type, period, outfile_format='png'):
+    ''' plot_data.py options of the benchmark runs (native velocity engine, no product cache) '''
+    from plot_data import create_parser as create_plot_data_parser
+    from prepare_and_plot import set_hardwired_options
+    data_dirs = [paths['scratch_dir'] + '/' + track + '/mintpy' for track in TRACKS]
+    plot_box = get_plot_box()
+    center = [(plot_box[0] + plot_box[1]) / 2, (plot_box[2] + plot_box[3]) / 2]
+    args = data_dirs + ['--plot-type', plot_type, '--period', period, '--velocity-engine', 'native', '--no-cache',
+                        '--plot-box', ','.join(str(val) for val in plot_box), '--ref-point', f'{center[0]},{center[1] + 0.1}',
+                        '--gps', '--seismicity', '--gps-ref-station', paths['gps_sites'][0], '--dem-file', paths['dem_file']]
+    inps = create_plot_data_parser(args)
+    set_hardwired_options(inps)
+    return inps
+
+def run_stages(paths, fdsn_url, sizes, repeat=1, verbose=False):
+    import numpy as np
+    from helper_functions import get_file_names, find_nearest_start_end_date
+    from velocity import estimate_velocity
+    from products import read_attributes, read_coherence, mask_data, reference_data, get_window, get_point_window, read_window
+
+    timer = StageTimer(verbose)
+    track, other_track = list(TRACKS)
+    track_dir = paths['scratch_dir'] + '/' + track + '/mintpy'
+    date_list = get_date_list(sizes['num_dates'])
+    period = date_list[len(date_list) // 4] + '-' + date_list[-1]
+    plot_box = get_plot_box()
+
+    # InSAR stages
+    files = timer.run('file_discovery_cold', get_file_names, track_dir)
+    timer.run('file_discovery_warm', get_file_names, track_dir, repeat=repeat)
+    eos_file = files[0] if files else paths['tracks'][track]
+    dates = timer.run('date_snapping', find_nearest_start_end_date, eos_file, period, repeat=repeat)
+    start_date, end_date = dates if dates else (date_list[0], date_list[-1])
+    atr = read_attributes(eos_file)
+    window = get_window(atr, plot_box)
+    reference_lalo = [(plot_box[0] + plot_box[1]) / 2, (plot_box[2] + plot_box[3]) / 2 + 0.1]
+    result = timer.run('velocity', estimate_velocity, eos_file, start_date, end_date, window=window, repeat=repeat)
+    if result:
+        velocity, velocity_atr = result
+        velocity = timer.run('masking', lambda: mask_data(velocity, read_coherence(eos_file, window), 0.7), repeat=repeat)
+        ref_velocity, q = estimate_velocity(eos_file, start_date, end_date, window=get_point_window(atr, reference_lalo))
+        timer.run('referencing', reference_data, velocity, velocity_atr, reference_lalo, ref_value=ref_velocity[0, 0], repeat=repeat)
+    timer.run('horzvert', run_horzvert, paths, start_date, end_date, repeat=repeat)
+
+    # DEM, GPS and seismicity
+    from hillshade import read_hillshade
+    timer.run('dem_shading_cold', read_hillshade, paths['dem_file'], plot_box, 1000)
+    timer.run('dem_shading_warm', read_hillshade, paths['dem_file'], plot_box, 1000, repeat=repeat)
+    from gps import get_gps
+    gps_args = [paths['gps_dir'], paths['gps_dir'] + '/GPS_BenBrooks_03-05full.txt', plot_box, start_date, end_date, 'cm', 4]
+    timer.run('gps_velocities_cold', get_gps, *gps_args, ref_site=paths['gps_sites'][0])
+    timer.run('gps_velocities_warm', get_gps, *gps_args, ref_site=paths['gps_sites'][0], repeat=repeat)
+    from seismicity import get_earthquakes, normalize_earthquake_times
+    timer.run('seismicity_fetch_cold', get_earthquakes, start_date, end_date, plot_box, url=fdsn_url)
+    events_df = timer.run('seismicity_fetch_warm', get_earthquakes, start_date, end_date, plot_box, url=fdsn_url, repeat=repeat)
+    if events_df is not None:
+        timer.run('seismicity_parse', normalize_earthquake_times, events_df, start_date, end_date, repeat=repeat)
+
+    # whole prepare stage and headless rendering
+    import matplotlib
+    matplotlib.use('Agg')
+    from prepare_and_plot import run_prepare, run_plot
+    inps = get_inps(paths, 'velocity', period)
+    data_dict = timer.run('run_prepare', run_prepare, inps, repeat=repeat)
+    if data_dict:
+        outfile = paths['scratch_dir'] + '/benchmark_velocity.png'
+        timer.run('render', run_plot, data_dict, inps, outfile=outfile, repeat=repeat)
+    inps = get_inps(paths, 'ifgram', period)
+    inps.max_btemp = 24
+    data_dict = timer.run('run_prepare_ifgram', run_prepare, inps, repeat=repeat)
+    if data_dict:
+        outfile = paths['scratch_dir'] + '/benchmark_ifgram.png'
+        timer.run('render_ifgram', run_plot, data_dict, inps, outfile=outfile, repeat=repeat)
+    inps = get_inps(paths, 'shaded-relief', period)
+    data_dict = timer.run('run_prepare_shaded_relief', run_prepare, inps)
+    if data_dict:
+        outfile = paths['scratch_dir'] + '/benchmark_shaded_relief.png'
+        timer.run('render_shaded_relief', run_plot, data_dict, inps, outfile=outfile, repeat=repeat)
+    return timer.results
+
+def run_horzvert(paths, start_date, end_date):
+    ''' velocities of both tracks inside the plot_box decomposed into horizontal and vertical '''
+    from velocity import estimate_velocity
+    from products import read_attributes, get_window, read_geometry
+    from decomposition import get_common_grid, resample_to_grid, decompose
+    tracks = []
+    for eos_file in paths['tracks'].values():
+        window = get_window(read_attributes(eos_file), get_plot_box())
+        tracks.append(estimate_velocity(eos_file, start_date, end_date, window=window) + read_geometry(eos_file, window))
+    grid_atr = get_common_grid([track[1] for track in tracks], get_plot_box())
+    los, incidence, azimuth = [[resample_to_grid(track[i], track[1], grid_atr) for track in tracks] for i in [0, 2, 3]]
+    return decompose(los, incidence, azimuth)
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(iargs=None):
+    inps = create_parser().parse_args(args=iargs)
+    sizes = dict(SIZES[inps.size])
+    for key in sizes:
+        if getattr(inps, key) is not None:
+            sizes[key] = getattr(inps, key)
+
+    work_dir = inps.work_dir or tempfile.mkdtemp(prefix='plotdata_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ['SCRATCHDIR'] = work_dir
+    os.environ['PLOTDATA_CACHE'] = work_dir + '/cache'
+    os.environ['GPSDIR'] = work_dir + '/GPS'
+    print('synthetic data:', sizes, 'in', work_dir)
+    start = time.perf_counter()
+    paths = write_synthetic_data(work_dir, **sizes)
+    events = get_events(sizes['num_events'], sizes['num_dates'])
+    server, fdsn_url = start_fdsn_server(events)
+    generation_time = time.perf_counter() - start
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        stages = run_stages(paths, fdsn_url, sizes, inps.repeat, inps.verbose)
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        if not inps.keep and not inps.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {'commit': get_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'machine': platform.machine(), 'sizes': sizes, 'repeat': inps.repeat,
+               'generation_seconds': round(generation_time, 2), 'stages': stages}
+    output = inps.output or f'benchmark_{inps.size}.json'
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results:', output)
+
+############################################################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of PlotData                              #
+# Startup benchmark: import time of the CLI and modules    #
+############################################################
+# Runs each entry of startup_budget.json with `python -X importtime` (best of --repeat runs) and
+# fails (exit code 1) if the import time exceeds its budget or a forbidden module is imported.
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+EXAMPLE = """example:
+  python benchmarks/startup_benchmark.py
+  python benchmarks/startup_benchmark.py --repeat 10 --output startup.json
+  python benchmarks/startup_benchmark.py --budget-scale 2        (slower machine)
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Import time of plot_data.py and the PlotData modules',
+                                     epilog=EXAMPLE, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--budget-file', dest='budget_file', default=os.path.dirname(os.path.abspath(__file__)) + '/startup_budget.json',
+                        help='budgets (Default: startup_budget.json next to this script)')
+    parser.add_argument('--repeat', dest='repeat', default=5, type=int, help='runs per entry, the fastest counts (Default: 5)')
+    parser.add_argument('--budget-scale', dest='budget_scale', default=1.0, type=float, help='factor applied to all budgets (Default: 1)')
+    parser.add_argument('--output', dest='output', default=None, help='write results as JSON')
+    return parser
+
+def measure_import_time(args):
+    ''' total import time (ms) and cumulative time (ms) of every imported module of `python -X importtime args` '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + '/src' + os.pathsep + env.get('PYTHONPATH', '')
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=REPO_DIR, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        modules[module] = cumulative / 1000
+        if indent == 1:
+            total += cumulative                 # top-level imports only, nested ones are included
+    if proc.returncode != 0:
+        raise Exception('ERROR: ' + ' '.join(args) + ' failed:\n' + proc.stderr[-2000:])
+    return total / 1000, modules
+
+def main(iargs=None):
+    inps = create_parser().parse_args(args=iargs)
+    with open(inps.budget_file) as f:
+        budgets = json.load(f)
+
+    results = {}
+    failed = False
+    print(f"{'entry':20s} {'import ms':>10s} {'budget ms':>10s}  status")
+    for name, entry in budgets.items():
+        best = None
+        for i in range(inps.repeat):
+            total, modules = measure_import_time(entry['args'])
+            if best is None or total < best[0]:
+                best = (total, modules)
+        total, modules = best
+        budget = entry['budget_ms'] * inps.budget_scale
+        top_level = {module.split('.')[0] for module in modules}
+        forbidden = sorted(set(entry.get('forbidden', [])) & top_level)
+        status = 'ok'
+        if total > budget:
+            status = 'over budget'
+        if forbidden:
+            status = 'imports ' + ', '.join(forbidden)
+        failed = failed or status != 'ok'
+        heaviest = sorted(modules.items(), key=lambda item: -item[1])[:5]
+        results[name] = {'import_ms': round(total, 2), 'budget_ms': budget, 'status': status,
+                         'heaviest': {module: round(ms, 2) for module, ms in heaviest}}
+        print(f"{name:20s} {total:10.1f} {budget:10.1f}  {status}")
+
+    if inps.output:
+        with open(inps.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+############################################################
+if __name__ == '__main__':
+    main()
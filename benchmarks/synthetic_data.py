@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of PlotData                              #
+# Synthetic data for the benchmark suite                   #
+############################################################
+# Writes a $SCRATCHDIR-like directory with two HDF-EOS5 tracks (SyntheticSenDT87, SyntheticSenAT124),
+# geo_velocity.h5, geo_geometryRadar.h5, geo_ifgramStack.h5 and geo_maskTempCoh.h5 per track, a DEM, GPS station files with a station list,
+# and provides a local stand-in for the FDSN event service.
+import os
+import json
+import threading
+import numpy as np
+import h5py
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SIZES = {
+    'small':  {'length': 300, 'width': 300, 'num_dates': 50, 'num_stations': 20, 'num_events': 2000},
+    'medium': {'length': 1000, 'width': 1000, 'num_dates': 100, 'num_stations': 100, 'num_events': 20000},
+    'large':  {'length': 2000, 'width': 2000, 'num_dates': 200, 'num_stations': 500, 'num_events': 200000},
+}
+TRACKS = {'SyntheticSenDT87': {'heading': -168.0, 'incidence': 39.0, 'direction': 'DESCENDING', 'track': '87'},
+          'SyntheticSenAT124': {'heading': -12.0, 'incidence': 34.0, 'direction': 'ASCENDING', 'track': '124'}}
+EOS_GRID = 'HDFEOS/GRIDS/timeseries'
+FIRST_DATE = datetime(2020, 1, 1)
+LAT_FIRST, LON_FIRST, EXTENT = 19.7, -155.8, 0.4         # area of the synthetic data (degrees)
+
+def get_attributes(length, width):
+    return {'Y_FIRST': str(LAT_FIRST), 'Y_STEP': str(-EXTENT / length), 'X_FIRST': str(LON_FIRST),
+            'X_STEP': str(EXTENT / width), 'LENGTH': str(length), 'WIDTH': str(width)}
+
+def get_plot_box(margin=0.1):
+    ''' plot_box inside the synthetic area '''
+    return [LAT_FIRST - EXTENT * (1 - margin), LAT_FIRST - EXTENT * margin, LON_FIRST + EXTENT * margin, LON_FIRST + EXTENT * (1 - margin)]
+
+def get_date_list(num_dates):
+    return [(FIRST_DATE + timedelta(days=12 * i)).strftime('%Y%m%d') for i in range(num_dates)]
+
+def get_deformation(length, width):
+    ''' east, north, up velocity (m/yr) of an inflating point source in the center '''
+    y, x = np.mgrid[0:length, 0:width]
+    dy, dx = (y - length / 2) / length, (x - width / 2) / width
+    r2 = (dx**2 + dy**2) / 0.04
+    up = 0.05 * np.exp(-r2)
+    radial = 0.03 * np.sqrt(r2) * np.exp(-r2)
+    r = np.maximum(np.hypot(dx, dy), 1e-9)
+    return radial * dx / r, -radial * dy / r, up
+
+def get_azimuth(heading):
+    ''' azimuth angle of the line of sight from the satellite heading (MintPy convention) '''
+    azimuth = -1 * (180 + heading + 90)
+    return azimuth - np.round(azimuth / 360.) * 360.
+
+def get_los_velocity(east, north, up, incidence, heading):
+    ''' line-of-sight velocity (MintPy convention) '''
+    inc = np.deg2rad(incidence)
+    az = np.deg2rad(get_azimuth(heading))
+    return east * -np.sin(inc) * np.sin(az) + north * np.sin(inc) * np.cos(az) + up * np.cos(inc)
+
+def write_track(track_dir, track, length, width, num_dates, seed=0):
+    ''' HDF-EOS5 file, geo_velocity.h5 and geo_geometryRadar.h5 of one track, returns the HDF-EOS5 file '''
+    rng = np.random.default_rng(seed)
+    settings = TRACKS[track]
+    os.makedirs(track_dir + '/mintpy/geo', exist_ok=True)
+    atr = get_attributes(length, width)
+    atr.update({'ORBIT_DIRECTION': settings['direction'], 'relative_orbit': settings['track'], 'PROJECT_NAME': track,
+                'HEADING': str(settings['heading']), 'UNIT': 'm'})
+    date_list = get_date_list(num_dates)
+    years = np.array([(datetime.strptime(date, '%Y%m%d') - FIRST_DATE).days / 365.25 for date in date_list])
+
+    east, north, up = get_deformation(length, width)
+    velocity = get_los_velocity(east, north, up, settings['incidence'], settings['heading']).astype(np.float32)
+    coherence = np.clip(rng.normal(0.85, 0.1, (length, width)), 0, 1).astype(np.float32)
+    height = get_height(length, width)
+    incidence = np.full((length, width), settings['incidence'], dtype=np.float32)
+    azimuth = np.full((length, width), get_azimuth(settings['heading']), dtype=np.float32)
+
+    eos_file = track_dir + '/mintpy/S1_synthetic_' + date_list[0] + '_' + date_list[-1] + '.he5'
+    with h5py.File(eos_file, 'w') as f:
+        f.attrs.update(atr)
+        f[EOS_GRID + '/observation/date'] = np.array(date_list, dtype=np.bytes_)
+        dset = f.create_dataset(EOS_GRID + '/observation/displacement', (num_dates, length, width), dtype=np.float32,
+                                chunks=(num_dates, min(length, 128), min(width, 128)))
+        for i, t in enumerate(years):
+            dset[i] = velocity * t + rng.normal(0, 0.003, (length, width)).astype(np.float32)
+        f[EOS_GRID + '/quality/temporalCoherence'] = coherence
+        f[EOS_GRID + '/geometry/height'] = height
+        f[EOS_GRID + '/geometry/incidenceAngle'] = incidence
+        f[EOS_GRID + '/geometry/azimuthAngle'] = azimuth
+
+    write_single_dataset(track_dir + '/mintpy/geo/geo_velocity.h5', {'velocity': velocity, 'step20210306': velocity * 0.1},
+                         dict(atr, FILE_TYPE='velocity', UNIT='m/year', START_DATE=date_list[0], END_DATE=date_list[-1],
+                              REF_DATE=date_list[0], **{'mintpy.timeFunc.stepDate': '20210306'}))
+    write_single_dataset(track_dir + '/mintpy/geo/geo_geometryRadar.h5',
+                         {'height': height, 'incidenceAngle': incidence, 'azimuthAngle': azimuth}, dict(atr, FILE_TYPE='geometry'))
+    write_single_dataset(track_dir + '/mintpy/geo/geo_maskTempCoh.h5', {'mask': coherence > 0.7}, dict(atr, FILE_TYPE='mask'))
+    write_ifgram_stack(track_dir + '/mintpy/geo/geo_ifgramStack.h5', velocity, date_list, years, atr, rng)
+    return eos_file
+
+def write_ifgram_stack(fname, velocity, date_list, years, atr, rng, wavelength=0.05546576):
+    ''' MintPy ifgramStack with the sequential pairs and pairs skipping one date '''
+    pairs = [(i, i + 1) for i in range(len(date_list) - 1)] + [(i, i + 2) for i in range(len(date_list) - 2)]
+    length, width = velocity.shape
+    with h5py.File(fname, 'w') as f:
+        f.attrs.update(dict(atr, FILE_TYPE='ifgramStack', WAVELENGTH=str(wavelength), UNIT='radian'))
+        f['date'] = np.array([[date_list[i], date_list[j]] for i, j in pairs], dtype=np.bytes_)
+        f['dropIfgram'] = np.ones(len(pairs), dtype=bool)
+        dset = f.create_dataset('unwrapPhase', (len(pairs), length, width), dtype=np.float32, chunks=(1, min(length, 128), min(width, 128)))
+        for k, (i, j) in enumerate(pairs):
+            displacement = velocity * (years[j] - years[i]) + rng.normal(0, 0.003, (length, width)).astype(np.float32)
+            dset[k] = displacement * -4 * np.pi / wavelength
+
+def write_single_dataset(fname, datasets, atr):
+    ''' MintPy style file with 2D datasets at the root '''
+    with h5py.File(fname, 'w') as f:
+        for name, data in datasets.items():
+            f[name] = data
+        f.attrs.update(atr)
+
+def get_height(length, width):
+    ''' volcano-shaped topography with some texture for the hillshade (m) '''
+    y, x = np.mgrid[0:length, 0:width]
+    height = 4000 * np.exp(-((y - length / 2)**2 + (x - width / 2)**2) / (0.3 * length * width)) + 50 * np.sin(x / 7) * np.cos(y / 11)
+    return height.astype(np.float32)
+
+def write_dem(fname, length, width):
+    write_single_dataset(fname, {'height': get_height(length, width)}, dict(get_attributes(length, width), FILE_TYPE='dem', UNIT='m'))
+    return fname
+
+def write_gps(gps_dir, num_stations, num_dates, seed=0):
+    ''' daily NGL tenv3 station files and the station list, returns station names '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(gps_dir, exist_ok=True)
+    num_days = num_dates * 12
+    header = ('site YYMMMDD yyyy.yyyy __MJD week d reflon _e0(m) __east(m) ____n0(m) _north(m) u0(m) ____up(m) _ant(m) '
+              'sig_e(m) sig_n(m) sig_u(m) __corr_en __corr_eu __corr_nu')
+    names = [f'S{i:03d}' for i in range(num_stations)]
+    lats = LAT_FIRST - EXTENT * rng.uniform(0.05, 0.95, num_stations)
+    lons = LON_FIRST + EXTENT * rng.uniform(0.05, 0.95, num_stations)
+    with open(gps_dir + '/GPS_BenBrooks_03-05full.txt', 'w') as f:
+        f.write('Site Lat Lon\n')
+        for name, lat, lon in zip(names, lats, lons):
+            f.write(f'{name} {lat:.5f} {lon:.5f}\n')
+
+    dates = [FIRST_DATE + timedelta(days=i) for i in range(num_days)]
+    years = np.array([date.year + (date.timetuple().tm_yday - 0.5) / 365.25 for date in dates])
+    t = np.arange(num_days) / 365.25
+    for name in names:
+        velocity = rng.normal(0, 0.02, 3)
+        enu = velocity[:, np.newaxis] * t + rng.normal(0, 0.002, (3, num_days))
+        with open(gps_dir + '/' + name + '.txt', 'w') as f:
+            f.write(header + '\n')
+            for i, date in enumerate(dates):
+                f.write(f"{name} {date.strftime('%y%b%d').upper()} {years[i]:.4f} {58849 + i} 2000 {i % 7} -155.5 "
+                        f"0 {enu[0, i]:.5f} 0 {enu[1, i]:.5f} 0 {enu[2, i]:.5f} 0.0 0.001 0.001 0.003 0.0 0.0 0.0\n")
+    return names
+
+def get_events(num_events, num_dates, seed=0):
+    ''' synthetic catalog: time (ms), lat, lon, depth (km), magnitude '''
+    rng = np.random.default_rng(seed)
+    start = FIRST_DATE.replace(tzinfo=timezone.utc).timestamp() * 1000
+    duration = num_dates * 12 * 86400 * 1000
+    return {'time': np.sort(rng.uniform(start, start + duration, num_events)).astype(np.int64),
+            'lat': LAT_FIRST - EXTENT * rng.uniform(0, 1, num_events),
+            'lon': LON_FIRST + EXTENT * rng.uniform(0, 1, num_events),
+            'depth': rng.uniform(-10, 10, num_events),
+            'mag': np.round(rng.exponential(0.6, num_events) + 1, 1)}
+
+def start_fdsn_server(events, port=0):
+    ''' local stand-in for the FDSN event service (geojson), returns the server and its url '''
+
+    class FDSNHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = {key: value[0] for key, value in parse_qs(urlparse(self.path).query).items()}
+            to_ms = lambda date: datetime.strptime(date, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp() * 1000
+            select = ((events['time'] >= to_ms(query['starttime'])) & (events['time'] <= to_ms(query['endtime'])) &
+                      (events['lat'] >= float(query['minlatitude'])) & (events['lat'] <= float(query['maxlatitude'])) &
+                      (events['lon'] >= float(query['minlongitude'])) & (events['lon'] <= float(query['maxlongitude'])) &
+                      (events['depth'] >= float(query.get('mindepth', -1000))) & (events['depth'] <= float(query.get('maxdepth', 1000))))
+            features = [{'id': f'syn{i}', 'properties': {'mag': float(events['mag'][i]), 'time': int(events['time'][i])},
+                         'geometry': {'coordinates': [float(events['lon'][i]), float(events['lat'][i]), float(events['depth'][i])]}}
+                        for i in np.flatnonzero(select)]
+            content = json.dumps({'type': 'FeatureCollection', 'features': features}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('localhost', port), FDSNHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://localhost:{server.server_port}/fdsnws/event/1/query'
+
+def write_synthetic_data(scratch_dir, length, width, num_dates, num_stations, **kwargs):
+    ''' all synthetic files under scratch_dir, returns dict of paths '''
+    paths = {'scratch_dir': scratch_dir, 'tracks': {}}
+    for i, track in enumerate(TRACKS):
+        paths['tracks'][track] = write_track(scratch_dir + '/' + track, track, length, width, num_dates, seed=i)
+    paths['dem_file'] = write_dem(scratch_dir + '/dem.h5', length, width)
+    paths['gps_dir'] = scratch_dir + '/GPS/data'
+    paths['gps_sites'] = write_gps(paths['gps_dir'], num_stations, num_dates)
+    return paths
@@ -0,0 +1,183 @@
+#! /usr/bin/env python3
+# Headless batch rendering of many figures from a job file (plot_data.py batch jobs.yaml).
+# Jobs with the same prepare inputs are run by the same worker and prepare once; overlays
+# (fault lines, seismicity, GPS) are reused within a worker for jobs with the same inputs.
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import traceback
+
+EXAMPLE = """example:
+  plot_data.py batch nightly.yaml --workers 4
+  plot_data.py batch nightly.json --out-dir $SCRATCHDIR/MaunaLoa/nightly --format pdf
+
+job file (YAML or JSON): a list of jobs, or a dict with 'jobs' and optional 'defaults', 'out_dir', 'format'.
+A job has a name, data_dir (one or two directories) and plot_data.py options by long name:
+  out_dir: $SCRATCHDIR/MaunaLoa/nightly
+  format: png
+  defaults: {ref-point: '19.495,-155.555', plot-box: '19.43:19.5,-155.62:-155.55', gps: true, seismicity: true}
+  jobs:
+    - {name: DT87_velocity, data_dir: MaunaLoaSenDT87/mintpy_5_20, period: 20220101-20230101, vlim: [-5, 5]}
+    - {name: horzvert, data_dir: [MaunaLoaSenDT87/mintpy_5_20, MaunaLoaSenAT124/mintpy_5_20], plot-type: horzvert}
+    - {name: Galapagos, data_dir: GalapagosSenDT128/mintpy, ref-point: '-0.81,-91.19', plot-box: '-0.86:-0.77,-91.19:-91.07'}
+"""
+
+JOB_KEYS = ['name', 'data_dir', 'format', 'outfile']        # job entries that are not plot_data.py options
+PREPARE_OPTIONS = ['data_dir', 'plot_type', 'period', 'plot_box', 'reference_lalo', 'mask_vmin', 'velocity_engine',
+                   'dem_file', 'flag_save_gbis', 'flag_save_products', 'flag_no_cache', 'flag_refresh',
+                   'horzvert_components', 'horz_az', 'max_memory', 'date12', 'max_btemp', 'export_format', 'export_dir']
+
+overlay_cache = {}                  # overlays computed in this (worker) process
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='plot_data.py batch', description='Headless batch rendering of figures from a job file',
+                                     epilog=EXAMPLE, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('job_file', help='YAML or JSON job file')
+    parser.add_argument('--workers', dest='workers', default=1, type=int, help='number of worker processes (Default: 1)')
+    parser.add_argument('--out-dir', dest='out_dir', default=None, help='directory for figures and summary (Default: out_dir of job file or its directory)')
+    parser.add_argument('--format', dest='format', choices=['png', 'pdf'], default=None, help='figure format (Default: format of job file or png)')
+    return parser
+
+def read_job_file(job_file):
+    ''' settings (dict) and jobs (list of dicts with the defaults applied) of a YAML or JSON job file '''
+    with open(job_file) as f:
+        if job_file.endswith(('.yaml', '.yml')):
+            import yaml
+            settings = yaml.safe_load(f)
+        else:
+            settings = json.load(f)
+    if isinstance(settings, list):
+        settings = {'jobs': settings}
+    defaults = settings.get('defaults') or {}
+    jobs = []
+    for i, job in enumerate(settings['jobs']):
+        job = {**defaults, **job}
+        job.setdefault('name', f'job{i:03d}')
+        jobs.append(job)
+    return settings, jobs
+
+def get_job_args(job):
+    ''' plot_data.py arguments of a job '''
+    args = [job['data_dir']] if isinstance(job['data_dir'], str) else list(job['data_dir'])
+    for key, value in job.items():
+        if key in JOB_KEYS or value is None or value is False:
+            continue
+        option = '--' + key.replace('_', '-')
+        if value is True:
+            args.append(option)
+        elif isinstance(value, (list, tuple)):
+            args += [option] + [str(val) for val in value]
+        else:
+            # --option=value: values starting with '-' (southern latitudes, western longitudes) are not options
+            args.append(option + '=' + os.path.expandvars(str(value)))
+    return args
+
+def get_prepare_key(inps):
+    ''' jobs with the same key share the prepared products '''
+    return json.dumps([getattr(inps, option, None) for option in PREPARE_OPTIONS])
+
+def group_jobs(jobs):
+    ''' groups of jobs run by one worker: same prepare inputs '''
+    groups = {}
+    for job in jobs:
+        key = get_prepare_key(job['inps'])
+        groups.setdefault(key, []).append(job)
+    return list(groups.values())
+
+def run_job_group(jobs):
+    ''' prepare and render the jobs of a group, returns one result dict per job '''
+    import matplotlib
+    matplotlib.use('Agg')                   # also in worker processes, which do not inherit the backend
+    from prepare_and_plot import run_prepare, run_plot, set_hardwired_options, start_prefetch
+    products = {}
+    results = []
+    for job in jobs:
+        inps = copy.copy(job['inps'])
+        result = {'name': job['name'], 'outfile': job['outfile'], 'status': 'ok', 'reused_products': False,
+                  'prepare_time': 0., 'plot_time': 0.}
+        start_time = time.time()
+        try:
+            set_hardwired_options(inps)
+            key = get_prepare_key(inps)
+            if key in products:
+                data_dict, inps.plot_box = products[key]
+                result['reused_products'] = True
+                prefetch = None
+            else:
+                prefetch = start_prefetch(inps)
+                data_dict = run_prepare(inps)
+                products[key] = (data_dict, inps.plot_box)
+            prepare_time = time.time()
+            result['prepare_time'] = round(prepare_time - start_time, 3)
+            run_plot(data_dict, inps, outfile=job['outfile'], overlay_cache=overlay_cache, prefetch=prefetch)
+            result['plot_time'] = round(time.time() - prepare_time, 3)
+        except Exception as error:
+            traceback.print_exc()
+            result['status'] = 'failed'
+            result['error'] = str(error)
+        result['total_time'] = round(time.time() - start_time, 3)
+        results.append(result)
+    return results
+
+def run_batch(job_file, parse_job_args, workers=1, out_dir=None, format=None):
+    ''' render all jobs of job_file, parse_job_args: function converting plot_data.py arguments to inps '''
+    import matplotlib
+    matplotlib.use('Agg')
+    settings, jobs = read_job_file(job_file)
+    out_dir = os.path.expandvars(out_dir or settings.get('out_dir') or os.path.dirname(os.path.abspath(job_file)))
+    os.makedirs(out_dir, exist_ok=True)
+
+    results = {}
+    valid_jobs = []
+    for job in jobs:
+        job_format = format or job.get('format') or settings.get('format') or 'png'
+        job['outfile'] = os.path.expandvars(job.get('outfile') or out_dir + '/' + job['name'] + '.' + job_format)
+        try:
+            job['inps'] = parse_job_args(get_job_args(job))
+        except (Exception, SystemExit) as error:
+            results[job['name']] = {'name': job['name'], 'outfile': job['outfile'], 'status': 'failed',
+                                    'error': 'invalid job: ' + str(error), 'total_time': 0.}
+            continue
+        valid_jobs.append(job)
+
+    start_time = time.time()
+    groups = group_jobs(valid_jobs)
+    if workers > 1 and len(groups) > 1:
+        # workers started by a fork server: they start overlay prefetch threads and the --jobs pools of their own
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups)), mp_context=multiprocessing.get_context('forkserver')) as executor:
+            group_results = list(executor.map(run_job_group, groups))
+    else:
+        group_results = [run_job_group(group) for group in groups]
+    for result in [result for group in group_results for result in group]:
+        results[result['name']] = result
+    results = [results[job['name']] for job in jobs]
+
+    summary = {'job_file': os.path.abspath(job_file), 'workers': workers, 'total_time': round(time.time() - start_time, 3),
+               'num_failed': sum(result['status'] != 'ok' for result in results), 'jobs': results}
+    summary_file = out_dir + '/batch_summary.json'
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"{'job':30s} {'status':7s} {'prepare':>8s} {'plot':>8s} {'total':>8s}  output")
+    for result in results:
+        output = result['outfile'] if result['status'] == 'ok' else result['error']
+        print(f"{result['name']:30s} {result['status']:7s} {result.get('prepare_time', 0.):8.2f} {result.get('plot_time', 0.):8.2f} "
+              f"{result['total_time']:8.2f}  {output}")
+    print(f"{len(results)} jobs, {summary['num_failed']} failed, {summary['total_time']:.1f} s, summary: {summary_file}")
+    return summary
+
+def main(iargs, parse_job_args):
+    inps = create_parser().parse_args(args=iargs)
+    from minsar.objects import message_rsmas
+    message_rsmas.log(os.getcwd(), 'plot_data.py batch ' + ' '.join(iargs))
+    job_file = os.path.abspath(inps.job_file)
+    out_dir = os.path.abspath(os.path.expandvars(inps.out_dir)) if inps.out_dir else None
+    os.chdir(os.getenv('SCRATCHDIR'))
+    summary = run_batch(job_file, parse_job_args, inps.workers, out_dir, inps.format)
+    if summary['num_failed']:
+        sys.exit(1)
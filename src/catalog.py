@@ -0,0 +1,172 @@
+#! /usr/bin/env python3
+# SQLite catalog of the HDF-EOS5 files under $SCRATCHDIR: path, track, orbit direction, date list,
+# extent and attributes. Files are only opened again when their size or modification time changed.
+import os
+import re
+import glob
+import json
+import bisect
+import sqlite3
+import argparse
+import h5py
+from helper_functions import get_cache_dir
+from velocity import get_timeseries_dataset_names
+
+EXAMPLE = """example:
+  plot_data.py catalog
+  plot_data.py catalog --plot-box 19.43:19.5,-155.62:-155.55 --period 20220101-20230101
+  plot_data.py catalog --plot-box 19.43:19.5,-155.62:-155.55 --partial --orbit-direction ascending
+"""
+
+scanned_patterns = set()            # glob patterns refreshed in this process
+
+def open_catalog():
+    ''' open (and create) the catalog '''
+    con = sqlite3.connect(get_cache_dir('catalog') + '/catalog.sqlite', timeout=60)
+    con.execute('''CREATE TABLE IF NOT EXISTS products (
+                   path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, ctime REAL, project TEXT, track TEXT,
+                   orbit_direction TEXT, date_list TEXT, start_date TEXT, end_date TEXT,
+                   min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL, attributes TEXT)''')
+    con.commit()
+    return con
+
+def read_eos_metadata(eos_file):
+    ''' catalog row of a HDF-EOS5 file '''
+    with h5py.File(eos_file, 'r') as f:
+        atr = {key: value.decode('utf8') if isinstance(value, bytes) else str(value) for key, value in f.attrs.items()}
+        date_list = [date.decode('utf8') for date in f[get_timeseries_dataset_names(f)[1]][:]]
+    length = int(atr.get('LENGTH', atr.get('FILE_LENGTH')))
+    lat0 = float(atr['Y_FIRST'])
+    lat1 = lat0 + length * float(atr['Y_STEP'])
+    lon0 = float(atr['X_FIRST'])
+    lon1 = lon0 + int(atr['WIDTH']) * float(atr['X_STEP'])
+
+    # track and orbit direction from the attributes, else from the project name (e.g. MaunaLoaSenDT87)
+    project = atr.get('PROJECT_NAME', '')
+    match = re.search(r'(Sen|Csk)(AT|DT)(\d+)', project + ' ' + eos_file)
+    track = atr.get('relative_orbit', atr.get('trackNumber', match.group(3) if match else ''))
+    orbit_direction = atr.get('ORBIT_DIRECTION', '').upper()
+    if not orbit_direction and match:
+        orbit_direction = 'ASCENDING' if match.group(2) == 'AT' else 'DESCENDING'
+
+    stat = os.stat(eos_file)
+    return (eos_file, stat.st_size, stat.st_mtime_ns, stat.st_ctime, project, str(track), orbit_direction,
+            ','.join(date_list), date_list[0], date_list[-1], min(lat0, lat1), max(lat0, lat1),
+            min(lon0, lon1), max(lon0, lon1), json.dumps(atr))
+
+def refresh_files(con, files):
+    ''' add new and re-read changed files '''
+    files = [os.path.abspath(file) for file in files]
+    known = {}
+    for i in range(0, len(files), 500):
+        chunk = files[i:i + 500]
+        rows = con.execute(f"SELECT path, size, mtime FROM products WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+        known.update({path: (size, mtime) for path, size, mtime in rows})
+    changed = 0
+    for file in files:
+        stat = os.stat(file)
+        if known.get(file) == (stat.st_size, stat.st_mtime_ns):
+            continue
+        try:
+            row = read_eos_metadata(file)
+        except (OSError, KeyError):
+            print('catalog: not a HDF-EOS5 timeseries file:', file)
+            continue
+        con.execute(f"INSERT OR REPLACE INTO products VALUES ({','.join('?' * len(row))})", row)
+        changed += 1
+    if changed:
+        con.commit()
+    return files
+
+def refresh_pattern(con, pattern):
+    ''' refresh the files matching the glob pattern and remove files that were deleted (once per process) '''
+    pattern = os.path.abspath(pattern)
+    files = refresh_files(con, glob.glob(pattern))
+    if pattern not in scanned_patterns:
+        directory = os.path.dirname(re.split(r'[*?\[]', pattern)[0] + 'x')          # directory before the first wildcard
+        rows = con.execute("SELECT path FROM products WHERE path LIKE ?", (directory + '/%',)).fetchall()
+        deleted = [(path,) for path, in rows if not os.path.exists(path)]
+        if deleted:
+            con.executemany("DELETE FROM products WHERE path = ?", deleted)
+            con.commit()
+        scanned_patterns.add(pattern)
+    return files
+
+def get_youngest_file(pattern):
+    ''' the most recently created HDF-EOS5 file matching pattern, or None '''
+    con = open_catalog()
+    files = refresh_pattern(con, pattern)
+    row = None
+    if files:
+        row = con.execute(f"SELECT path FROM products WHERE path IN ({','.join('?' * len(files))}) ORDER BY ctime DESC LIMIT 1",
+                          files).fetchone()
+    con.close()
+    return row[0] if row else None
+
+def get_date_list(eos_file):
+    ''' date list (YYYYMMDD) of a HDF-EOS5 file '''
+    con = open_catalog()
+    eos_file = refresh_files(con, [eos_file])[0]
+    row = con.execute("SELECT date_list FROM products WHERE path = ?", (eos_file,)).fetchone()
+    con.close()
+    if row is None:
+        raise Exception('USER ERROR: not a HDF-EOS5 timeseries file: ' + eos_file)
+    return row[0].split(',')
+
+def snap_date(date_list, date):
+    ''' latest date of the (sorted) date_list on or before date, None if there is none '''
+    i = bisect.bisect_right(date_list, date)
+    return date_list[i - 1] if i > 0 else None
+
+def find_products(plot_box=None, start_date=None, end_date=None, orbit_direction=None, partial=False):
+    ''' catalog rows (dicts) of the files covering plot_box=[lat_min, lat_max, lon_min, lon_max] (partial: overlapping)
+    with data between start_date and end_date (YYYYMMDD) '''
+    query = 'SELECT path, project, track, orbit_direction, start_date, end_date, min_lat, max_lat, min_lon, max_lon FROM products WHERE 1'
+    params = []
+    if plot_box and partial:
+        query += ' AND min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?'
+        params += [plot_box[1], plot_box[0], plot_box[3], plot_box[2]]
+    elif plot_box:
+        query += ' AND min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?'
+        params += [plot_box[0], plot_box[1], plot_box[2], plot_box[3]]
+    if start_date:
+        query += ' AND end_date >= ?'
+        params.append(start_date)
+    if end_date:
+        query += ' AND start_date <= ?'
+        params.append(end_date)
+    if orbit_direction:
+        query += ' AND orbit_direction = ?'
+        params.append(orbit_direction.upper())
+    con = open_catalog()
+    columns = ['path', 'project', 'track', 'orbit_direction', 'start_date', 'end_date', 'min_lat', 'max_lat', 'min_lon', 'max_lon']
+    rows = [dict(zip(columns, row)) for row in con.execute(query + ' ORDER BY project, path', params)]
+    con.close()
+    return rows
+
+def scan_scratchdir():
+    ''' refresh the catalog with all HDF-EOS5 files in $SCRATCHDIR/*/mintpy*/ and $SCRATCHDIR/*/network*/ '''
+    con = open_catalog()
+    files = []
+    for pattern in ['/*/mintpy*/*.he5', '/*/network*/*.he5']:
+        files += refresh_pattern(con, os.getenv('SCRATCHDIR') + pattern)
+    con.close()
+    return files
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='plot_data.py catalog', description='Query the catalog of HDF-EOS5 files in $SCRATCHDIR',
+                                     epilog=EXAMPLE, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--plot-box', dest='plot_box', default=None, help='files covering the area')
+    parser.add_argument('--period', dest='period', metavar='YYYYMMDD-YYYYMMDD', default=None, help='files with data in the period')
+    parser.add_argument('--orbit-direction', dest='orbit_direction', default=None, help='ascending or descending')
+    parser.add_argument('--partial', dest='partial', action='store_true', default=False, help='files overlapping (not covering) the area')
+    return parser
+
+def main(iargs):
+    inps = create_parser().parse_args(args=iargs)
+    plot_box = [float(val) for val in inps.plot_box.replace(':', ',').split(',')] if inps.plot_box else None
+    start_date, end_date = inps.period.split('-') if inps.period else (None, None)
+    scan_scratchdir()
+    for row in find_products(plot_box, start_date, end_date, inps.orbit_direction, inps.partial):
+        print(f"{row['path']}  track {row['track']} {row['orbit_direction']}  {row['start_date']}-{row['end_date']}  "
+              f"{row['min_lat']:.3f}:{row['max_lat']:.3f},{row['min_lon']:.3f}:{row['max_lon']:.3f}")
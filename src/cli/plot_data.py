@@ -8,28 +8,43 @@ import os
 import sys
 import re
 import argparse
-from minsar.objects import message_rsmas
 
 ############################################################
 EXAMPLE = """example:
   cmd = 'plot_data.py --help
+        plot_data.py batch nightly.yaml --workers 4          (see plot_data.py batch --help)
+        plot_data.py catalog --plot-box 19.43:19.5,-155.62:-155.55 --period 20220101-20230101   (see plot_data.py catalog --help)
+        plot_data.py serve MaunaLoaSenDT87/mintpy_5_20 $SCRATCHDIR/MaunaLoa/up.h5 $SCRATCHDIR/MaunaLoa/hz.h5 --dem-file $SCRATCHDIR/MaunaLoa/MLtry/data/demGeo.h5   (see plot_data.py serve --help)
         plot_data.py MaunaLoaSenDT87 --plot-type ifgram --seismicity --gps
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 --plot-type ifgram --period 20220901-20221231 --max-btemp 24 --plot-box 19.43:19.5,-155.62:-155.55
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 --plot-type ifgram --date12 20221115_20221127 20221127_20221209 --gallery-columns 2
         plot_data.py MaunaLoaSenDT87 --plot-type shaded_relief --seismicity --gps
         plot_data.py MaunaLoaSenDT87 --plot-type velocity --seismicity --gps
         plot_data.py MaunaLoaSenAT124 MaunaLoaSenDT87 --ref-point 19.55,-155.45
         plot_data.py MaunaLoaSenDT87/mintpy_5_20  --plot-type velocity
         plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 --plot-type velocity --ref-point 19.495,-155.555  --period 20181001-20221122 --plot-box 19.43:19.5,-155.62:-155.55 --vlim -5 5
         plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 --plot-type horzvert --ref-point 19.495,-155.555  --period 20181001-20221122 --plot-box 19.43:19.5,-155.62:-155.55 --vlim -5 5
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 --plot-type horzvert --ref-point 19.495,-155.555  --period 20181001-20221122 --jobs 2
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 --plot-type horzvert --period 20181001-20221122 --export-format cog --export-dir $SCRATCHDIR/MaunaLoa/export
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 MaunaLoaCskAT10/mintpy --plot-type horzvert --ref-point 19.495,-155.555  --period 20181001-20221122
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 MaunaLoaCskAT10/mintpy MaunaLoaCskDT3/mintpy --plot-type horzvert --horzvert-components enu
         plot_data.py MaunaLoaSenDT87/mintpy_5_20  --plot-type shaded-relief --gps --period 20181001-20221122 --dem-file $SCRATCHDIR/MaunaLoa/MLtry/data/demGeo.h5
         plot_data.py MaunaLoaSenDT87/mintpy_5_20  --plot-type shaded-relief --gps --gps-scale-fac 200 --gps-key-length 1
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20  --plot-type shaded-relief --gps --gps-ref-station auto --ref-point 19.55,-155.45
         plot_data.py MaunaLoaSenDT87/mintpy_5_20  --plot-type shaded-relief --plot-box 19.43:19.5,-155.62:-155.55  --seismicity
+        plot_data.py KilaueaSenDT87/mintpy  --plot-type shaded-relief --seismicity --mag-range 2 10 --seismicity-mode density --seismicity-color count
         plot_data.py GalapagosSenDT128/mintpy  --plot-type=velocity --plot-box=-0.52:-0.28,-91.7:-91.4 --period=20200131-20231231 --gps --seismicity
         plot_data.py GalapagosSenDT128/mintpy GalapagosSenAT106/mintpy_orig  --plot-type=horzvert --plot-box=-1.0:-0.75,-91.55:-91.25 --period=20220101-20230831 --vlim -5 5
         plot_data.py MaunaLoaSenDT87/mintpy_5_20 MaunaLoaSenAT124/mintpy_5_20 --plot-type velocity --ref-point 19.55,-155.45 --period 20220801-20221127 --vlim -20 20 --save-gbis --gps --seismicity --fontsize 14
         plot_data.py GalapagosSenDT128/mintpy  --plot-type=velocity --plot-box=-0.52:-0.28,-91.7:-91.4 --period=20200131-20221231 --gps --seismicity
+        plot_data.py GalapagosSenDT128/mintpy  --plot-type=velocity --period=20200131-20221231 --refresh
+        plot_data.py GalapagosSenDT128/mintpy  --plot-type=velocity --period=20200131-20221231 --velocity-engine native
+        plot_data.py GalapagosSenDT128/mintpy  --plot-type=velocity --period=20200131-20221231 --profile galapagos_trace.json
+        plot_data.py ChilesSenDT142/mintpy --plot-type=velocity --period=20170101-20231231 --velocity-engine native --max-memory 4
+        plot_data.py MaunaLoaSenDT87/mintpy_5_20 --period 20220101-20230601 --sliding-window 6m:1m --plot-box 19.43:19.5,-155.62:-155.55 --ref-point 19.495,-155.555 --vlim -10 10
 """
 
-def create_parser():
+def create_parser(iargs=None):
     synopsis = 'Plotting of InSAR, GPS and Seismicity data'
     epilog = EXAMPLE
     parser = argparse.ArgumentParser(description=synopsis, epilog=epilog, formatter_class=argparse.RawTextHelpFormatter)
@@ -39,11 +54,23 @@ def create_parser():
     parser.add_argument('--period', dest='period', metavar='YYYYMMDD-YYYYMMDD', default=None, help='time period (Default: full time period)')    
     parser.add_argument('--seismicity', dest='flag_seismicity', action='store_true', default=False, help='flag to add seismicity')
     parser.add_argument('--gps', dest='flag_gps', action='store_true', default=False, help='flag to add GPS vectors')
+    parser.add_argument('--offline', dest='flag_offline', action='store_true', default=False, help='use only locally stored seismicity (no download)')
+    parser.add_argument('--fdsn-url', dest='fdsn_url', default=None, help='FDSN event service (Default: $PLOTDATA_FDSN_URL or USGS)')
+    parser.add_argument('--depth-range', dest='depth_range', nargs=2, metavar=('MIN', 'MAX'), default=['0', '10'], help='depth range of the earthquakes in km (Default: 0 10)')
+    parser.add_argument('--mag-range', dest='mag_range', nargs=2, metavar=('MIN', 'MAX'), default=None, help='magnitude range of the earthquakes (Default: all)')
+    parser.add_argument('--seismicity-mode', dest='seismicity_mode', choices=['auto', 'scatter', 'rasterized', 'density'], default='auto',
+                        help='one marker per event (scatter), markers as image in PDF/SVG (rasterized) or hexagonal bins (density).\nauto: density above --seismicity-max-events (Default: auto)')
+    parser.add_argument('--seismicity-max-events', dest='seismicity_max_events', type=int, default=10000, help='maximum number of events drawn as markers with --seismicity-mode auto (Default: 10000)')
+    parser.add_argument('--seismicity-color', dest='seismicity_color', choices=['time', 'count'], default='time', help='color of the density bins: mean time or number of events (Default: time)')
     parser.add_argument('--plot-type', dest='plot_type', default='velocity', help='Type of plot: velocity, horzvert, ifgram, step, shaded_relief (Default: velocity).')
+    parser.add_argument('--date12', dest='date12', nargs='+', metavar='YYYYMMDD_YYYYMMDD', default=None, help='interferograms for --plot-type ifgram (Default: all in --period)')
+    parser.add_argument('--max-btemp', dest='max_btemp', type=int, default=None, help='maximum temporal baseline in days of the interferograms (Default: no limit)')
+    parser.add_argument('--gallery-columns', dest='gallery_columns', type=int, default=None, help='number of columns of the interferogram gallery (Default: square)')
     parser.add_argument('--dem-file', dest='dem_file', default=None, help='external DEM file (Default: geo/geo_geometryRadar.h5)')
     parser.add_argument('--lines', dest='line_file', default=None, help='fault file (Default: None, but plotdata/data/hawaii_lines_new.mat for Hawaii)')
     parser.add_argument('--gps-scale-fac', dest='gps_scale_fac', default=500, type=int, help='GPS scale factor (Default: 500)')
     parser.add_argument('--gps-key-length', dest='gps_key_length', default=4, type=int, help='GPS key length (Default: 4)')
+    parser.add_argument('--gps-ref-station', dest='gps_ref_station', default='MKEA', help='GPS reference station, auto for the station nearest to --ref-point or the plot_box center (Default: MKEA)')
     parser.add_argument('--gps-units', dest='gps_unit', default="cm", help='GPS units (Default: cm)')
     parser.add_argument('--unit', dest='unit', default="cm", help='InSAR units (Default: cm)')
     parser.add_argument('--fontsize', dest='font_size', default=12, type=int, help='fontsize for view.py (Default: 12)')
@@ -51,11 +78,28 @@ def create_parser():
     parser.add_argument('--mask-thresh', dest='mask_vmin', type=float, default=0.7, help='coherence threshold for masking (Default: 0.7)')
     parser.add_argument('--vlim', dest='vlim', nargs=2, metavar=('VMIN', 'VMAX'), type=float, help='colorlimit')
     parser.add_argument('--save-gbis', dest='flag_save_gbis', action='store_true', default=False, help='save GBIS files')
+    parser.add_argument('--save-products', dest='flag_save_products', action='store_true', default=False, help='write prepared products (geo_velocity.h5, geo_step.h5) to the project directory')
+    parser.add_argument('--export-format', dest='export_format', choices=['cog', 'h5chunked'], default=None,
+                        help='export the prepared products as tiled, compressed Cloud-Optimized GeoTIFF (needs GDAL) or chunked HDF5\nwith overviews, and a manifest.json of their extents and periods (Default: no export)')
+    parser.add_argument('--export-dir', dest='export_dir', default=None, help='directory for --export-format (Default: export/ next to the products, for interferograms in the project directory)')
+    parser.add_argument('--velocity-engine', dest='velocity_engine', choices=['mintpy', 'native'], default='mintpy', help='velocity estimation with timeseries2velocity.py or in-process (Default: mintpy)')
+    parser.add_argument('--horzvert-components', dest='horzvert_components', choices=['horzvert', 'enu'], default='horzvert', help='horzvert: horizontal and up; enu: east, north and up, needs 3 or more tracks with different look directions (Default: horzvert)')
+    parser.add_argument('--horz-az', dest='horz_az', type=float, default=-90, help='azimuth angle of the horizontal component, anti-clockwise from north, -90 for east (Default: -90)')
+    parser.add_argument('--sliding-window', dest='sliding_window', metavar='LEN:STEP', default=None, help='velocity maps for windows of LEN stepped by STEP (e.g. 6m:1m, 90d:30d, 1y:3m) saved as image sequence and GIF')
+    parser.add_argument('--profile', dest='profile', nargs='?', const='plotdata_profile.json', default=None, metavar='TRACE_FILE',
+                        help='record time, CPU, peak memory and I/O of all stages, write Chrome trace (Default: plotdata_profile.json) and summary')
+    parser.add_argument('--jobs', dest='jobs', default=1, type=int, help='number of tracks prepared in parallel (Default: 1)')
+    parser.add_argument('--no-cache', dest='flag_no_cache', action='store_true', default=False, help='do not use the cache of prepared products')
+    parser.add_argument('--refresh', dest='flag_refresh', action='store_true', default=False, help='recalculate prepared products and update the cache')
+    parser.add_argument('--max-memory', dest='max_memory', default=None, type=float, help='memory limit in GB: rasters are processed in strips of rows and multilooked for display if needed (Default: no limit)')
+    parser.add_argument('--cache-size', dest='cache_size', default=5.0, type=float, help='size limit of the product cache in GB (Default: 5)')
 
-    inps = parser.parse_args()
+    inps = parser.parse_args(args=iargs)
 
-    if len(inps.data_dir) < 1 or len(inps.data_dir) > 2:
-        parser.error('USER ERROR: You must provide 1 or 2 directory paths.')
+    if len(inps.data_dir) < 1:
+        parser.error('USER ERROR: You must provide at least 1 directory path.')
+    if inps.plot_type == 'horzvert' and len(inps.data_dir) < (3 if inps.horzvert_components == 'enu' else 2):
+        parser.error('USER ERROR: --plot-type horzvert needs at least 2 directory paths (3 for --horzvert-components enu).')
         
     if inps.plot_box:
         inps.plot_box = [float(val) for val in inps.plot_box.replace(':', ',').split(',')]  # converts to plot_box=[19.3, 19.6, -155.8, -155.4]
@@ -63,6 +107,15 @@ def create_parser():
         reference_lalo = inps.reference_lalo
         inps.reference_lalo = [float(val) for val in reference_lalo.split(',')]         # converts to reference_point=[19.3, -155.8]
 
+    if inps.sliding_window:
+        from helper_functions import parse_time_interval
+        inps.sliding_window_str = inps.sliding_window
+        inps.sliding_window = [parse_time_interval(val) for val in inps.sliding_window.split(':')]   # converts to [relativedelta(months=+6), relativedelta(months=+1)]
+
+    inps.depth_range = ' '.join(inps.depth_range)                                      # converts to depth_range='0 10'
+    if inps.mag_range:
+        inps.mag_range = ' '.join(inps.mag_range)
+
     if inps.dem_file and '$' in inps.dem_file:
         inps.dem_file = os.path.expandvars(inps.dem_file)
 
@@ -74,6 +127,22 @@ def create_parser():
 
 ############################################################
 def main(iargs):
+    if len(iargs) > 1 and iargs[1] == 'batch':
+        # headless rendering of the jobs of a job file
+        import batch
+        batch.main(iargs[2:], create_parser)
+        return
+    if len(iargs) > 1 and iargs[1] == 'catalog':
+        # query the catalog of HDF-EOS5 files
+        import catalog
+        catalog.main(iargs[2:])
+        return
+    if len(iargs) > 1 and iargs[1] == 'serve':
+        # local XYZ tile server over prepared products
+        import tile_server
+        tile_server.main(iargs[2:])
+        return
+
     if len(iargs) == 1:
         # called without arguments (from vscode)
         cmd = 'plot_data.py --help'
@@ -91,15 +160,34 @@ def main(iargs):
 
     inps = create_parser()
     print('inps: ',inps)
+    from minsar.objects import message_rsmas
     message_rsmas.log(os.getcwd(), os.path.basename(__file__) + ' ' + ' '.join(sys.argv[1:]))
 
     # import
     from prepare_and_plot import run_prepare
     from prepare_and_plot import run_plot
+    from prepare_and_plot import run_sliding_window
+    from prepare_and_plot import start_prefetch
+    from prepare_and_plot import set_hardwired_options
+    
+    if inps.profile:
+        import profiling
+        profiling.enable()
+        inps.profile = os.path.abspath(inps.profile)
     
     os.chdir(os.getenv('SCRATCHDIR'))
-    data_dict = run_prepare(inps)
-    run_plot(data_dict, inps)
+    set_hardwired_options(inps)
+    try:
+        if inps.sliding_window:
+            run_sliding_window(inps)
+        else:
+            prefetch = start_prefetch(inps)
+            data_dict = run_prepare(inps)
+            run_plot(data_dict, inps, prefetch=prefetch)
+    finally:
+        if inps.profile:
+            profiling.write_trace(inps.profile)
+            profiling.print_summary()
 
     return
 
@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+# Decomposition of line-of-sight velocities of any number of tracks into horizontal and vertical
+# (or east, north and up) components. The tracks are resampled onto their common grid and the
+# weighted least-squares system is solved for all pixels at once, in blocks of rows.
+import numpy as np
+
+COMPONENTS = {'horzvert': ['hz', 'up'], 'enu': ['east', 'north', 'up']}
+TRACK_KEYS = ['ORBIT_DIRECTION', 'HEADING', 'relative_orbit', 'trackNumber']      # attributes of a single track
+
+def get_common_grid(atr_list, plot_box=None):
+    ''' attributes of the grid covered by all tracks (inside plot_box=[lat_min, lat_max, lon_min, lon_max]),
+    with the pixel spacing of the first track '''
+    y_step = float(atr_list[0]['Y_STEP'])
+    x_step = float(atr_list[0]['X_STEP'])
+    lat_max = min(float(atr['Y_FIRST']) for atr in atr_list)
+    lat_min = max(float(atr['Y_FIRST']) + int(atr.get('LENGTH', atr.get('FILE_LENGTH'))) * float(atr['Y_STEP']) for atr in atr_list)
+    lon_min = max(float(atr['X_FIRST']) for atr in atr_list)
+    lon_max = min(float(atr['X_FIRST']) + int(atr['WIDTH']) * float(atr['X_STEP']) for atr in atr_list)
+    if plot_box:
+        lat_min, lat_max = max(lat_min, plot_box[0]), min(lat_max, plot_box[1])
+        lon_min, lon_max = max(lon_min, plot_box[2]), min(lon_max, plot_box[3])
+    length = int(round((lat_max - lat_min) / abs(y_step)))
+    width = int(round((lon_max - lon_min) / x_step))
+    if length <= 0 or width <= 0:
+        raise Exception('USER ERROR: tracks do not overlap inside the plot box -- exiting')
+
+    # the components are not products of one track: no orbit attributes, reference pixel on the grid
+    grid_atr = {key: value for key, value in atr_list[0].items() if key not in TRACK_KEYS + ['REF_Y', 'REF_X']}
+    grid_atr.update({'Y_FIRST': str(lat_max), 'X_FIRST': str(lon_min), 'LENGTH': str(length), 'FILE_LENGTH': str(length),
+                     'WIDTH': str(width)})
+    if 'REF_LAT' in grid_atr:
+        ref_y = int(np.floor((float(grid_atr['REF_LAT']) - lat_max) / y_step + 0.01))
+        ref_x = int(np.floor((float(grid_atr['REF_LON']) - lon_min) / x_step + 0.01))
+        if 0 <= ref_y < length and 0 <= ref_x < width:
+            grid_atr.update({'REF_Y': str(ref_y), 'REF_X': str(ref_x)})
+    return grid_atr
+
+def resample_to_grid(data, atr, grid_atr):
+    ''' nearest-neighbour resampling of data onto the grid, NaN outside of data '''
+    def get_index(first, step, num, grid_first, grid_step, grid_num):
+        center = grid_first + (np.arange(grid_num) + 0.5) * grid_step
+        index = np.floor((center - first) / step).astype(int)
+        return index, (index >= 0) & (index < num)
+
+    rows, row_valid = get_index(float(atr['Y_FIRST']), float(atr['Y_STEP']), data.shape[0],
+                                float(grid_atr['Y_FIRST']), float(grid_atr['Y_STEP']), int(grid_atr['LENGTH']))
+    cols, col_valid = get_index(float(atr['X_FIRST']), float(atr['X_STEP']), data.shape[1],
+                                float(grid_atr['X_FIRST']), float(grid_atr['X_STEP']), int(grid_atr['WIDTH']))
+    out = np.full((rows.size, cols.size), np.nan, dtype=np.float32)
+    out[np.ix_(row_valid, col_valid)] = data[np.ix_(rows[row_valid], cols[col_valid])]
+    return out
+
+def get_design_matrix(incidence, azimuth, components='horzvert', horz_az=-90):
+    ''' line-of-sight unit vector projected on the components (MintPy angle convention),
+    shape (..., number of components) '''
+    inc = np.deg2rad(incidence)
+    az = np.deg2rad(azimuth)
+    east = -np.sin(inc) * np.sin(az)
+    north = np.sin(inc) * np.cos(az)
+    up = np.cos(inc)
+    if components == 'enu':
+        return np.stack([east, north, up], axis=-1)
+    horz = east * -np.sin(np.deg2rad(horz_az)) + north * np.cos(np.deg2rad(horz_az))
+    return np.stack([horz, up], axis=-1)
+
+def decompose(los_list, incidence_list, azimuth_list, weight_list=None, components='horzvert', horz_az=-90,
+              max_block_size=1e6, min_rcond=1e-3):
+    ''' per-pixel weighted least-squares solution of the line-of-sight velocities of the tracks (arrays on the
+    same grid). Returns a list of arrays in the order of COMPONENTS[components]; NaN where fewer tracks than
+    components have data or the geometry does not resolve the components. '''
+    num_tracks = len(los_list)
+    num_components = len(COMPONENTS[components])
+    length, width = los_list[0].shape
+    solution = np.full((num_components, length, width), np.nan, dtype=np.float32)
+    if num_tracks < num_components:
+        raise Exception(f'USER ERROR: {components} needs at least {num_components} tracks -- exiting')
+
+    block_length = max(1, int(max_block_size // width))
+    for y0 in range(0, length, block_length):
+        y1 = min(y0 + block_length, length)
+        los = np.stack([data[y0:y1] for data in los_list]).reshape(num_tracks, -1)
+        G = np.stack([get_design_matrix(np.broadcast_to(inc, (length, width))[y0:y1], np.broadcast_to(az, (length, width))[y0:y1],
+                                        components, horz_az) for inc, az in zip(incidence_list, azimuth_list)])
+        G = G.reshape(num_tracks, -1, num_components)
+        if weight_list is None:
+            weight = np.ones(los.shape, dtype=np.float32)
+        else:
+            weight = np.stack([np.broadcast_to(w, (length, width))[y0:y1] for w in weight_list]).reshape(num_tracks, -1)
+        valid = np.isfinite(los) & np.isfinite(G).all(axis=-1) & (weight > 0)
+        weight = np.where(valid, weight, 0)
+        los = np.where(valid, los, 0)
+        G = np.where(valid[..., np.newaxis], G, 0)
+
+        # normal equations (pixel, component, component) of all pixels of the block
+        N = np.einsum('tp,tpi,tpj->pij', weight, G, G)
+        b = np.einsum('tp,tpi,tp->pi', weight, G, los)
+        eigenvalues = np.linalg.eigvalsh(N)
+        solvable = (valid.sum(axis=0) >= num_components) & (eigenvalues[:, 0] > min_rcond**2 * eigenvalues[:, -1])
+        x = np.full((N.shape[0], num_components), np.nan)
+        if solvable.any():
+            x[solvable] = np.linalg.solve(N[solvable], b[solvable][..., np.newaxis])[..., 0]
+        solution[:, y0:y1] = x.T.reshape(num_components, y1 - y0, width)
+    return list(solution)
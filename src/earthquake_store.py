@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# Local SQLite store of earthquake catalogs downloaded from a FDSN event service.
+# The coverage table records which (box, depth range, time interval) requests were downloaded,
+# so that repeated queries are answered locally and only uncovered time intervals are requested.
+import sqlite3
+
+def open_store(db_file):
+    ''' open (and create) the earthquake store '''
+    con = sqlite3.connect(db_file, timeout=60)
+    con.execute('''CREATE TABLE IF NOT EXISTS events (
+                   id TEXT PRIMARY KEY, time INTEGER, latitude REAL, longitude REAL, depth REAL, magnitude REAL)''')
+    con.execute('CREATE INDEX IF NOT EXISTS events_time ON events (time)')
+    con.execute('CREATE INDEX IF NOT EXISTS events_lalo ON events (latitude, longitude)')
+    con.execute('''CREATE TABLE IF NOT EXISTS coverage (
+                   min_lat REAL, max_lat REAL, min_lon REAL, max_lon REAL,
+                   min_depth REAL, max_depth REAL, start_time INTEGER, end_time INTEGER)''')
+    con.commit()
+    return con
+
+def get_uncovered_intervals(con, plot_box, depth_limits, start_time, end_time):
+    ''' time intervals [start, end] (ms) of the request not covered by earlier downloads of a larger or equal box '''
+    rows = con.execute('''SELECT start_time, end_time FROM coverage
+                          WHERE min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?
+                          AND min_depth <= ? AND max_depth >= ? AND end_time >= ? AND start_time <= ?
+                          ORDER BY start_time''',
+                       (plot_box[0], plot_box[1], plot_box[2], plot_box[3],
+                        depth_limits[0], depth_limits[1], start_time, end_time)).fetchall()
+    intervals = []
+    current = start_time
+    for t0, t1 in rows:
+        if t0 > current:
+            intervals.append([current, t0])
+        current = max(current, t1)
+        if current >= end_time:
+            break
+    if current < end_time:
+        intervals.append([current, end_time])
+    return intervals
+
+def add_events(con, events, plot_box, depth_limits, start_time, end_time):
+    ''' add events [[id, time, lat, lon, depth, mag], ...] and record the request as covered '''
+    con.executemany('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)', events)
+    con.execute('INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (plot_box[0], plot_box[1], plot_box[2], plot_box[3],
+                 depth_limits[0], depth_limits[1], start_time, end_time))
+    con.commit()
+
+def query_events(con, plot_box, depth_limits, start_time, end_time, mag_limits=None):
+    ''' events [[time, lat, lon, depth, mag], ...] inside plot_box, depth limits, time interval (ms) and magnitude limits '''
+    query = '''SELECT time, latitude, longitude, depth, magnitude FROM events
+               WHERE time >= ? AND time <= ? AND latitude >= ? AND latitude <= ?
+               AND longitude >= ? AND longitude <= ? AND depth >= ? AND depth <= ?'''
+    params = [start_time, end_time, plot_box[0], plot_box[1], plot_box[2], plot_box[3], depth_limits[0], depth_limits[1]]
+    if mag_limits:
+        query += ' AND magnitude >= ? AND magnitude <= ?'
+        params += mag_limits
+    rows = con.execute(query + ' ORDER BY time', params).fetchall()
+    return rows
@@ -0,0 +1,133 @@
+#! /usr/bin/env python3
+# Export of the prepared products for --export-format: Cloud-Optimized GeoTIFF (cog, needs GDAL) or chunked HDF5
+# (h5chunked), both tiled, compressed and with overview levels, and a manifest.json with extent and period of
+# every product in the export directory. Readers only need to read the tiles and the level of what they view.
+import os
+import json
+import numpy as np
+import h5py
+from products import get_overview_looks
+from strips import multilook
+
+TILE_SIZE = 256                     # tile (chunk) size in pixels, same as the tiles of the web map
+EXTENSIONS = {'cog': '.tif', 'h5chunked': '.h5'}
+
+def get_product_name(file):
+    ''' export name and dataset name of a data_dict entry (interferograms: stack.h5:unwrapPhase-date12) '''
+    if ':unwrapPhase-' in file:
+        return 'ifgram_' + file.split(':unwrapPhase-')[1], 'displacement'
+    name = os.path.splitext(os.path.basename(file))[0]
+    return name, 'step' if 'step' in name else 'velocity'
+
+def get_chunk_shape(shape, tile_size=TILE_SIZE):
+    ''' square chunks of tile_size pixels (smaller for small rasters) '''
+    return min(tile_size, shape[0]), min(tile_size, shape[1])
+
+def write_h5chunked(fname, data, atr, dset_name='velocity'):
+    ''' product as chunked, compressed HDF5 readable by MintPy, with the overview levels in the overviews group.
+    Returns the looks of the overview levels '''
+    looks_list = get_overview_looks(data.shape, min_size=TILE_SIZE)
+    with h5py.File(fname + '.tmp', 'w') as f:
+        for key, value in atr.items():
+            f.attrs[key] = str(value)
+        f.create_dataset(dset_name, data=data.astype(np.float32), chunks=get_chunk_shape(data.shape), compression='gzip',
+                         compression_opts=4, shuffle=True, fillvalue=np.nan)
+        for looks in looks_list:
+            overview = multilook(data, looks)
+            f.create_dataset('overviews/looks' + str(looks), data=overview, chunks=get_chunk_shape(overview.shape),
+                             compression='gzip', compression_opts=4, shuffle=True, fillvalue=np.nan)
+    os.replace(fname + '.tmp', fname)
+    return looks_list
+
+def write_cog(fname, data, atr):
+    ''' product as Cloud-Optimized GeoTIFF (deflate, TILE_SIZE tiles, NaN-aware average overviews).
+    Returns the looks of the overview levels '''
+    try:
+        from osgeo import gdal, osr
+    except ImportError:
+        raise Exception('USER ERROR: --export-format cog needs GDAL (osgeo), use --export-format h5chunked -- exiting')
+    gdal.UseExceptions()
+    length, width = data.shape
+    mem = gdal.GetDriverByName('MEM').Create('', width, length, 1, gdal.GDT_Float32)
+    mem.SetGeoTransform([float(atr['X_FIRST']), float(atr['X_STEP']), 0, float(atr['Y_FIRST']), 0, float(atr['Y_STEP'])])
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(int(atr.get('EPSG', 4326)))
+    mem.SetProjection(srs.ExportToWkt())
+    mem.SetMetadata({key: str(value) for key, value in atr.items()})
+    band = mem.GetRasterBand(1)
+    band.SetNoDataValue(float('nan'))
+    band.WriteArray(data.astype(np.float32))
+    looks_list = get_overview_looks(data.shape, min_size=TILE_SIZE)
+    if looks_list:
+        mem.BuildOverviews('AVERAGE', looks_list)
+    options = ['COMPRESS=DEFLATE', 'PREDICTOR=YES', 'BLOCKSIZE=' + str(TILE_SIZE), 'OVERVIEWS=FORCE_USE_EXISTING', 'BIGTIFF=IF_SAFER']
+    gdal.GetDriverByName('COG').CreateCopy(fname + '.tmp', mem, options=options)
+    mem = None
+    os.replace(fname + '.tmp', fname)
+    return looks_list
+
+def get_manifest_entry(fname, dset_name, dict, export_format, looks_list):
+    ''' extent (plot_box order: lat_min, lat_max, lon_min, lon_max), period, grid and layout of an exported product '''
+    atr = dict['atr']
+    length, width = dict['data'].shape
+    lat_first, lon_first = float(atr['Y_FIRST']), float(atr['X_FIRST'])
+    lat_last, lon_last = lat_first + length * float(atr['Y_STEP']), lon_first + width * float(atr['X_STEP'])
+    entry = {
+        'file': os.path.basename(fname),
+        'format': export_format,
+        'dataset': dset_name if export_format == 'h5chunked' else 1,
+        'start_date': dict['start_date'],
+        'end_date': dict['end_date'],
+        'plot_box': [min(lat_first, lat_last), max(lat_first, lat_last), min(lon_first, lon_last), max(lon_first, lon_last)],
+        'length': length,
+        'width': width,
+        'y_step': float(atr['Y_STEP']),
+        'x_step': float(atr['X_STEP']),
+        'unit': atr.get('UNIT', 'm/year'),
+        'tile_size': list(get_chunk_shape((length, width))),
+        'overviews': looks_list,
+    }
+    if 'REF_LAT' in atr:
+        entry['reference_lalo'] = [float(atr['REF_LAT']), float(atr['REF_LON'])]
+    return entry
+
+def update_manifest(export_dir, entries):
+    ''' add the entries to manifest.json of export_dir (replacing entries of the same file) '''
+    manifest_file = export_dir + '/manifest.json'
+    products = {}
+    if os.path.isfile(manifest_file):
+        with open(manifest_file) as f:
+            products = {entry['file']: entry for entry in json.load(f)['products']}
+    products.update({entry['file']: entry for entry in entries})
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump({'products': sorted(products.values(), key=lambda entry: entry['file'])}, f, indent=2)
+    os.replace(manifest_file + '.tmp', manifest_file)
+    return manifest_file
+
+def export_products(data_dict, export_format, export_dir=None):
+    ''' export all products of data_dict into export_dir (Default: export directory next to the products, for
+    interferograms in the project directory) and update the manifests. Returns the exported files '''
+    entries = {}
+    for file, dict in data_dict.items():
+        if 'data' not in dict:
+            continue
+        name, dset_name = get_product_name(file)
+        if 'track' in dict:
+            # interferograms of all tracks are exported into the project directory, e.g. SenDT87_ifgram_20221115_20221127
+            name = dict['track'] + '_' + name
+        product_dir = dict.get('out_dir') or os.path.dirname(file)
+        if export_dir:
+            # products of all tracks in one directory: prefixed by the track (or project) directory, e.g. SenDT87_geo_velocity
+            name = os.path.basename(os.path.normpath(product_dir)) + '_' + name
+        out_dir = export_dir or product_dir + '/export'
+        os.makedirs(out_dir, exist_ok=True)
+        fname = out_dir + '/' + name + EXTENSIONS[export_format]
+        if export_format == 'cog':
+            looks_list = write_cog(fname, dict['data'], dict['atr'])
+        else:
+            looks_list = write_h5chunked(fname, dict['data'], dict['atr'], dset_name)
+        entries.setdefault(out_dir, []).append(get_manifest_entry(fname, dset_name, dict, export_format, looks_list))
+        print('export:', fname)
+    for out_dir, dir_entries in entries.items():
+        update_manifest(out_dir, dir_entries)
+    return [out_dir + '/' + entry['file'] for out_dir, dir_entries in entries.items() for entry in dir_entries]
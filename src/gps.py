@@ -1,36 +1,28 @@
-import csv
 import datetime 
-import pandas as pd
-from pandas import read_csv
-from pandas import DataFrame
-from pandas import concat
+import numpy as np
 from datetime import datetime
-from sklearn import linear_model
 from dateutil.relativedelta import relativedelta
+from gps_store import get_gps_store, COMPONENTS, DAYS_PER_STATION
+from station_index import get_station_index
+from profiling import stage, profile_stage
 
-def get_gps(gps_dir, gps_list_file, plot_box, start_date, end_date, unit, key_length):
+@profile_stage('get_gps')
+def get_gps(gps_dir, gps_list_file, plot_box, start_date, end_date, unit, key_length, ref_site='MKEA', ref_lalo=None):
+    # ref_site='auto': station with data nearest to ref_lalo (Default: center of plot_box)
 
-    inf=open(gps_list_file)
-    next(inf)
-    reader=csv.reader(inf, delimiter=' ')
-    zipper=zip(*reader)
-    gpslist = list(next(zipper))
-    latlist = list(next(zipper))
-    lonlist = list(next(zipper))
-    new_gpslist = []
-    new_latlist = []
-    new_lonlist = []
-    
-    for i in range(0, len(gpslist)):
-       gps = gpslist[i]
-       lat = latlist[i]
-       lon = lonlist[i]
-       if float(lat) >= plot_box[0] and float(lat) <= plot_box[1] and float(lon) >= plot_box[2] and float(lon) <= plot_box[3]:
-            new_gpslist.append(gps)
-            new_latlist.append(lat)
-            new_lonlist.append(lon)
+    station_index = get_station_index(gps_list_file)
+    idx = station_index.in_box(plot_box)
+    new_gpslist = station_index.names[idx].tolist()
+    new_latlist = station_index.lats[idx].tolist()
+    new_lonlist = station_index.lons[idx].tolist()
+
+    if ref_site == 'auto':
+        if not ref_lalo:
+            ref_lalo = [(plot_box[0] + plot_box[1]) / 2, (plot_box[2] + plot_box[3]) / 2]
+        ref_site = get_nearest_gps_site(gps_dir, station_index, ref_lalo, start_date, end_date)
+        print('GPS reference station:', ref_site)
 
-    lat,lon,U,V,Z = get_quiver(gps_dir, new_gpslist, new_lonlist, new_latlist, start_date, end_date);
+    lat,lon,U,V,Z = get_quiver(gps_dir, new_gpslist, new_lonlist, new_latlist, start_date, end_date, ref_site);
     duration_years, quiver_label = generate_quiver_label(unit, key_length, start_date, end_date)
     
     if unit == 'cm':
@@ -40,40 +32,73 @@ def get_gps(gps_dir, gps_list_file, plot_box, start_date, end_date, unit, key_le
 
     return new_gpslist, lat, lon, U, V, Z, quiver_label
 
-def get_gps_vel(gps_dir, sitename,time1,time2):
-    filename =  gps_dir + '/' + sitename + '.txt'
-    dfin = read_csv(filename, header=0, delimiter=r"\s+")
-    index = ['Time', 'East', 'North', 'Up']
-    dataval=DataFrame(index=index);
-    dataerr=DataFrame(index=index);
-    dataval=concat([dfin['YYMMMDD'].rename('date'), (dfin['_e0(m)']+dfin['__east(m)']).rename('east'), (dfin['____n0(m)']+dfin['_north(m)']).rename('north'), 
-                    (dfin['u0(m)']+dfin['____up(m)']).rename('up'),dfin['yyyy.yyyy'].rename('dateval')], axis=1)
-    dataerr=concat([dfin['yyyy.yyyy'].rename('date'), dfin['sig_e(m)'], dfin['sig_n(m)'], dfin['sig_u(m)']], axis=1, 
-                 ignore_index=False);
-    dataval['date']=pd.to_datetime(dataval['date'], format='%y%b%d', errors='ignore')
-    dataerr['date']=pd.to_datetime(dataval['date'], format='%y%b%d', errors='ignore')
-    time1 = pd.to_datetime(time1)
-    time2 = pd.to_datetime(time2)
-    mask= (dataval['date'] > time1) & (dataval['date'] < time2)
-    dataval=dataval[mask];dataerr=dataerr[mask];
-    regr = linear_model.LinearRegression()
-    regr.fit(dataval['dateval'].values.reshape(-1,1),dataval['east'].values.reshape(-1,1));east_vel=regr.coef_[0][0];
-    regr.fit(dataval['dateval'].values.reshape(-1,1),dataval['north'].values.reshape(-1,1));north_vel=regr.coef_[0][0];
-    regr.fit(dataval['dateval'].values.reshape(-1,1),dataval['up'].values.reshape(-1,1));up_vel=regr.coef_[0][0];
-    return east_vel*1000, north_vel*1000,up_vel*1000;
+def get_gps_velocities(store, sites, date1, date2):
+    """ east, north, up velocities (mm/yr) of all sites between date1 and date2 (exclusive) from the
+    per-station prefix sums. Returns velocities (nan for skipped sites) and dict of skipped sites with reason. """
+    velocities = np.full((len(sites), 3), np.nan)
+    skipped = {}
+    number = np.array([store['index'].get(site, -1) for site in sites], dtype=np.int64)
+    if len(sites) == 0:
+        return velocities, skipped
+    known = number >= 0
+
+    # binary search of the period on the (station, date) keys
+    day1 = np.datetime64(date1, 'D').astype(np.int64)
+    day2 = np.datetime64(date2, 'D').astype(np.int64)
+    i0 = np.searchsorted(store['date_key'], number * DAYS_PER_STATION + day1, side='right')
+    i1 = np.searchsorted(store['date_key'], number * DAYS_PER_STATION + day2, side='left')
+    i1 = np.maximum(i0, i1)
+
+    n = (i1 - i0).astype(np.float64)
+    sum_t = store['sum_t'][i1] - store['sum_t'][i0]
+    denominator = n * (store['sum_tt'][i1] - store['sum_tt'][i0]) - sum_t**2
+    valid = known & (n >= 2) & (denominator > 0)
+    for j, key in enumerate(COMPONENTS):
+        sum_x = store['sum_' + key][i1] - store['sum_' + key][i0]
+        sum_tx = store['sum_t' + key][i1] - store['sum_t' + key][i0]
+        velocities[valid, j] = (n * sum_tx - sum_t * sum_x)[valid] / denominator[valid] * 1000
+
+    empty_sites = set(store['empty_sites'].tolist()) if 'empty_sites' in store else set()
+    for site, is_known, num, is_valid in zip(sites, known, n, valid):
+        if site in empty_sites:
+            skipped[site] = 'no data'
+        elif not is_known:
+            skipped[site] = 'no data file'
+        elif num < 2:
+            skipped[site] = f'{int(num)} observations in period'
+        elif not is_valid:
+            skipped[site] = 'no time span in period'
+    return velocities, skipped
+
+def get_nearest_gps_site(gps_dir, station_index, lalo, start_date, end_date, num_candidates=20):
+    ''' nearest station to lalo=[lat, lon] with a velocity for the period '''
+    store = get_gps_store(gps_dir)
+    idx = station_index.nearest(lalo[0], lalo[1], k=num_candidates)
+    sites = station_index.names[idx].tolist()
+    velocities, skipped = get_gps_velocities(store, sites, datetime.strptime(start_date, "%Y%m%d"), datetime.strptime(end_date, "%Y%m%d"))
+    for site in sites:
+        if site not in skipped:
+            return site
+    raise Exception('USER ERROR: no GPS station with data for the period near ' + str(lalo))
 
-def get_quiver(gps_dir, gpslist,lonlist,latlist,start_date,end_date):    
+def get_quiver(gps_dir, gpslist,lonlist,latlist,start_date,end_date,ref_site='MKEA'):    
     date1 = datetime.strptime(start_date, "%Y%m%d") 
     date2 = datetime.strptime(end_date, "%Y%m%d")
-    u_ref, v_ref, z_ref = get_gps_vel(gps_dir, 'MKEA', date1, date2)  #print u_ref,v_ref,z_ref
-    X,Y,U,V,Z=[],[],[],[],[]      
-    for i in range(len(gpslist)):
-        try:
-            u,v,z=get_gps_vel(gps_dir, gpslist[i],date1,date2);u=u-u_ref;v=v-v_ref;
-            U.append(float(u));V.append(float(v));Z.append(float(z));
-            X.append(float(lonlist[i])),Y.append(float(latlist[i]));
-        except:
-            pass
+    with stage('get_gps_store'):
+        store = get_gps_store(gps_dir)
+    with stage('get_gps_velocities'):
+        velocities, skipped = get_gps_velocities(store, [ref_site] + list(gpslist), date1, date2)
+    if ref_site in skipped:
+        raise Exception('USER ERROR: no GPS velocity for reference station ' + ref_site + ': ' + skipped[ref_site])
+    if skipped:
+        print('GPS stations skipped:', ', '.join(f'{site} ({reason})' for site, reason in skipped.items()))
+    u_ref, v_ref, z_ref = velocities[0]
+    valid = ~np.isnan(velocities[1:, 0])
+    U = (velocities[1:, 0][valid] - u_ref).tolist()
+    V = (velocities[1:, 1][valid] - v_ref).tolist()
+    Z = velocities[1:, 2][valid].tolist()
+    X = np.array(lonlist, dtype=float)[valid].tolist()
+    Y = np.array(latlist, dtype=float)[valid].tolist()
     return X,Y,U,V,Z
 
 def generate_quiver_label(unit, key_length, start_date, end_date):
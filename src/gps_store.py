@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+# Columnar store of the GPS station time series in $GPSDIR/data.
+# All stations are concatenated into float64 arrays (time, east, north, up and sigmas) with
+# per-station offsets; station files are only re-parsed when their modification time changes.
+import os
+import glob
+import hashlib
+import numpy as np
+from helper_functions import get_cache_dir
+
+COLUMNS = ['time', 'date', 'east', 'north', 'up', 'sig_e', 'sig_n', 'sig_u']
+COMPONENTS = ['east', 'north', 'up']
+DAYS_PER_STATION = 1000000          # date key: station number * DAYS_PER_STATION + days since 1970
+
+stores = {}                         # stores loaded in this process
+
+def read_station_file(filename):
+    ''' parse one station file (NGL tenv3 format) into a dict of arrays '''
+    from pandas import read_csv, to_datetime
+    dfin = read_csv(filename, header=0, delimiter=r"\s+")
+    station = {
+        'time': dfin['yyyy.yyyy'].values.astype(np.float64),
+        'date': to_datetime(dfin['YYMMMDD'], format='%y%b%d').values.astype('datetime64[D]'),
+        'east': (dfin['_e0(m)'] + dfin['__east(m)']).values.astype(np.float64),
+        'north': (dfin['____n0(m)'] + dfin['_north(m)']).values.astype(np.float64),
+        'up': (dfin['u0(m)'] + dfin['____up(m)']).values.astype(np.float64),
+        'sig_e': dfin['sig_e(m)'].values.astype(np.float64),
+        'sig_n': dfin['sig_n(m)'].values.astype(np.float64),
+        'sig_u': dfin['sig_u(m)'].values.astype(np.float64),
+    }
+    order = np.argsort(station['date'], kind='stable')
+    return {key: value[order] for key, value in station.items()}
+
+def load_store(store_file):
+    ''' stored arrays as dict, or None '''
+    if not os.path.isfile(store_file):
+        return None
+    with np.load(store_file) as npz:
+        store = {key: npz[key] for key in npz.files}
+    return store
+
+def save_store(store_file, store):
+    tmp_file = store_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **store)
+    os.replace(tmp_file, store_file)
+
+def get_gps_store(gps_dir):
+    ''' columnar store of all station files in gps_dir, updated for new, changed and removed files '''
+    store_file = get_cache_dir('gps') + '/' + hashlib.sha1(os.path.abspath(gps_dir).encode()).hexdigest()[:16] + '.npz'
+    files = {}
+    for filename in glob.glob(gps_dir + '/*.txt'):
+        files[os.path.basename(filename)[:-4]] = os.stat(filename).st_mtime_ns
+    if store_file in stores and stores[store_file]['file_dict'] == files:
+        return stores[store_file]
+    store = load_store(store_file)
+
+    old_index = {}
+    if store is not None:
+        old_index = {site: i for i, site in enumerate(store['sites'])}
+        old_files = dict(zip(store['files'].tolist(), store['file_mtimes'].tolist()))
+        if old_files == files:
+            return add_prefix_sums(store_file, store, files)
+
+    # (re-)ingest changed stations, keep the unchanged ones
+    stations = {}
+    for site in sorted(files):
+        i = old_index.get(site)
+        if i is not None and store['mtimes'][i] == files[site]:
+            stations[site] = {key: store[key][store['offsets'][i]:store['offsets'][i+1]] for key in COLUMNS}
+        else:
+            try:
+                stations[site] = read_station_file(gps_dir + '/' + site + '.txt')
+            except (KeyError, ValueError):
+                continue              # not a station file (e.g. the station list)
+
+    # stations without observations (header-only files) are not stored, only reported
+    empty_sites = [site for site in stations if len(stations[site]['time']) == 0]
+    sites = [site for site in stations if len(stations[site]['time']) > 0]
+    lengths = [len(stations[site]['time']) for site in sites]
+    store = {
+        'sites': np.array(sites, dtype=str),
+        'mtimes': np.array([files[site] for site in sites], dtype=np.int64),
+        'offsets': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        'empty_sites': np.array(empty_sites, dtype=str),
+        'files': np.array(list(files), dtype=str),
+        'file_mtimes': np.array(list(files.values()), dtype=np.int64),
+    }
+    for key in COLUMNS:
+        dtype = 'datetime64[D]' if key == 'date' else np.float64
+        store[key] = np.concatenate([stations[site][key] for site in sites]) if sites else np.array([], dtype=dtype)
+    print('GPS store: ingested', len(sites), 'stations from', gps_dir)
+    save_store(store_file, store)
+    return add_prefix_sums(store_file, store, files)
+
+def add_prefix_sums(store_file, store, files):
+    ''' add station index, date keys and per-station prefix sums of t, t^2, x and t*x (t relative to first epoch) '''
+    lengths = np.diff(store['offsets'])
+    station_number = np.repeat(np.arange(len(lengths)), lengths)
+    t = store['time'] - np.repeat(store['time'][store['offsets'][:-1]], lengths)
+    store['index'] = {site: i for i, site in enumerate(store['sites'])}
+    store['date_key'] = station_number * DAYS_PER_STATION + store['date'].astype(np.int64)
+    prefix = lambda x: np.concatenate([[0.], np.cumsum(x)])
+    store['sum_t'] = prefix(t)
+    store['sum_tt'] = prefix(t * t)
+    for key in COMPONENTS:
+        x = store[key] - np.repeat(store[key][store['offsets'][:-1]], lengths)
+        store['sum_' + key] = prefix(x)
+        store['sum_t' + key] = prefix(t * x)
+    store['file_dict'] = files
+    stores[store_file] = store
+    return store
+
+def get_station(store, site):
+    ''' arrays of one station (raises KeyError if the station is not in the store) '''
+    i = store['index'][site]
+    i0, i1 = store['offsets'][i], store['offsets'][i+1]
+    return {key: store[key][i0:i1] for key in COLUMNS}
@@ -2,12 +2,9 @@
 import os
 import argparse
 import subprocess
-import glob
-from mintpy.utils import readfile, writefile
-from mintpy.objects import HDFEOS
-from mintpy.utils.arg_utils import create_argument_parser
-import numpy as np
 from pathlib import Path
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
 
 
 EXAMPLE = """example:
@@ -70,13 +67,14 @@ def get_file_names(path):
     elif os.path.isfile(os.getenv('SCRATCHDIR') + '/' + path):
         eos_file = os.getenv('SCRATCHDIR') + '/' + path
     else:
+        # youngest file from the catalog (files are only opened if new or changed)
+        from catalog import get_youngest_file
         if 'mintpy' in path or 'network' in path :
-            files = glob.glob( path + '/*[0-9].he5' )
+            eos_file = get_youngest_file( path + '/*[0-9].he5' )
         else:
-            files = glob.glob( path + '/mintpy/*.he5' )
-        if len(files) == 0:
+            eos_file = get_youngest_file( path + '/mintpy/*.he5' )
+        if eos_file is None:
             raise Exception('USER ERROR: No HDF5EOS files found in ' + path)
-        eos_file = max(files, key=os.path.getctime)
     print('HDF5EOS file used:', eos_file)
 
     keywords = ['SenDT', 'SenAT', 'CskAT', 'CskDT']
@@ -112,16 +110,22 @@ def prepend_scratchdir_if_needed(path):
    
     return path
 
-def save_gbis_plotdata(eos_file, geo_vel_file, start_date_mod, end_date_mod):
+def save_gbis_plotdata(eos_file, geo_vel_file, start_date_mod, end_date_mod, velocity_engine='mintpy'):
     timeseries_file = eos_file.rsplit('/', 1)[0] + '/timeseries_tropHgt_demErr.h5'
     vel_file = geo_vel_file.replace('geo_','')
     geom_file = vel_file.replace('velocity','inputs/geometryRadar')
     print('eos_file', eos_file)
 
-    cmd = f'timeseries2velocity.py {timeseries_file} --start-date {start_date_mod} --end-date {end_date_mod} --output {vel_file}' 
+    if velocity_engine == 'native':
+        from velocity import estimate_velocity
+        from mintpy.utils import writefile
+        velocity, atr = estimate_velocity(timeseries_file, start_date_mod, end_date_mod)
+        writefile.write({'velocity': velocity}, out_file=vel_file, metadata=atr)
+    else:
+        cmd = f'timeseries2velocity.py {timeseries_file} --start-date {start_date_mod} --end-date {end_date_mod} --output {vel_file}' 
+        print('timeseries2velocity command:',cmd)
+        output = subprocess.check_output(cmd.split())
     cmd1 = f'save_gbis.py {vel_file} -g {os.path.dirname(eos_file)}/inputs/geometryRadar.h5' 
-    print('timeseries2velocity command:',cmd)
-    output = subprocess.check_output(cmd.split())
     print('save_gbis command:',cmd1.split())
     output = subprocess.check_output(cmd1.split())
 
@@ -140,8 +144,9 @@ def remove_directory_containing_mintpy_from_path(path):
   
 def find_nearest_start_end_date(fname, period):
     ''' Find nearest dates to start and end dates given as YYYYMMDD '''
+    from catalog import get_date_list, snap_date
     
-    dateList = HDFEOS(fname).get_date_list()
+    dateList = get_date_list(fname)
     
     if period:
         period = [val for val in period.split('-')]         # converts to period=['20220101', '20221101']
@@ -153,16 +158,9 @@ def find_nearest_start_end_date(fname, period):
         if int(end_date) > int(dateList[-1]):
             raise Exception("USER ERROR:  No date found later than ", end_date )
 
-        for date in reversed(dateList):
-            if int(date) <= int(start_date):
-                # print("Date just before start date:", date)
-                mod_start_date = date
-                break     
-        for date in reversed(dateList):
-            if int(date) <= int(end_date):
-                # print("Date just before end date:", date)
-                mod_end_date = date
-                break
+        # dates just before start and end date (binary search)
+        mod_start_date = snap_date(dateList, start_date)
+        mod_end_date = snap_date(dateList, end_date)
     else:
         mod_start_date = dateList[0]
         mod_end_date = dateList[-1]
@@ -196,10 +194,14 @@ def get_data_type(file):
             raise Exception('USER ERROR: direction is not A or D -- exiting ')  
     else:
         #print("File does not contain 'Sen' or 'Csk':", file)
-        if file == 'up.h5':
+        if os.path.basename(file) == 'up.h5':
             type = 'Up'
-        elif file == 'hz.h5':
+        elif os.path.basename(file) == 'hz.h5':
             type = 'Horz'
+        elif os.path.basename(file) == 'east.h5':
+            type = 'East'
+        elif os.path.basename(file) == 'north.h5':
+            type = 'North'
         else:
             type = 'Dem'
             #raise Exception('ERROR: file not up.h5 or horz.h5 -- exiting: ' + file)  
@@ -210,11 +212,41 @@ def get_plot_box(data_dict):
     ''' get plot_box from data_dict '''
     plot_box = []
     file = next(iter(data_dict))        # get first key
-    atr = readfile.read_attribute(file)
+    if 'atr' in data_dict[file]:
+        atr = data_dict[file]['atr']
+    else:
+        from mintpy.utils import readfile
+        atr = readfile.read_attribute(file)
     plot_box = [float(atr['Y_FIRST']) + int(atr['FILE_LENGTH'])*float(atr['Y_STEP']), float(atr['Y_FIRST']), 
         float(atr['X_FIRST']), float(atr['X_FIRST']) + int(atr['WIDTH'])*float(atr['X_STEP'])] 
     return plot_box
 
+def parse_time_interval(interval):
+    ''' 6m, 30d, 1y or 30 (days) to relativedelta '''
+    units = {'d': 'days', 'm': 'months', 'y': 'years'}
+    if interval[-1] in units:
+        return relativedelta(**{units[interval[-1]]: int(interval[:-1])})
+    return relativedelta(days=int(interval))
+
+def get_sliding_windows(start_date, end_date, window_length, window_step):
+    ''' windows [[start, end], ...] (YYYYMMDD) of window_length stepped by window_step (relativedelta) between start and end date '''
+    start = datetime.strptime(start_date, '%Y%m%d')
+    end = datetime.strptime(end_date, '%Y%m%d')
+    windows = []
+    while start + window_length <= end:
+        windows.append([start.strftime('%Y%m%d'), (start + window_length).strftime('%Y%m%d')])
+        start = start + window_step
+    return windows
+
+def get_cache_dir(name):
+    ''' get (and create) the cache directory $PLOTDATA_CACHE/name (Default: $SCRATCHDIR/.plotdata_cache/name) '''
+    if 'PLOTDATA_CACHE' in os.environ:
+        cache_dir = os.getenv('PLOTDATA_CACHE') + '/' + name
+    else:
+        cache_dir = os.getenv('SCRATCHDIR') + '/.plotdata_cache/' + name
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
 def get_dem_extent(atr_dem):
     # get the extent which is required for plotting
     # [-156.0, -154.99, 18.99, 20.00]
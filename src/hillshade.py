@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+# Cached hillshade pyramid of a DEM: shaded RGB levels (full resolution, 1/2, 1/4, ...) stored as
+# tiles of TILE_SIZE x TILE_SIZE pixels, computed once per DEM file and light source settings.
+# The DEM is shaded and the levels are reduced in strips of tile rows (within the --max-memory budget).
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import LightSource, Normalize
+from helper_functions import get_cache_dir, get_dem_extent
+from products import read_attributes, read_window, get_window, crop_attributes
+from strips import get_strip_rows
+from profiling import profile_stage
+
+TILE_SIZE = 256
+NODATA_COLOR = [255, 255, 255]      # pixels without elevation
+
+def get_hillshade_dir(dem_file, azdeg=315, altdeg=45, vert_exag=1.0):
+    ''' cache directory of the hillshade pyramid of dem_file and light source '''
+    stat = os.stat(dem_file)
+    params = [os.path.abspath(dem_file), stat.st_size, stat.st_mtime_ns, azdeg, altdeg, vert_exag]
+    key = hashlib.sha1(json.dumps(params).encode()).hexdigest()
+    return get_cache_dir('hillshade') + '/' + key
+
+def get_intensity(dem, ls, vert_exag=1.0):
+    ''' illumination of the DEM like LightSource.hillshade, but not normalized '''
+    e_dy, e_dx = np.gradient(vert_exag * dem, -1, 1)
+    normal = np.stack([-e_dx, -e_dy, np.ones_like(dem)], axis=-1)
+    normal /= np.sqrt(np.sum(normal**2, axis=-1))[..., np.newaxis]
+    return normal.dot(ls.direction)
+
+def shade_strips(dem_file, fname, azdeg=315, altdeg=45, vert_exag=1.0):
+    ''' shaded relief (uint8 RGB) of the DEM as tiles, computed in strips of tile rows, written into fname.
+    The first pass gets the elevation and illumination ranges, the second pass shades; strips overlap by one row
+    so that the gradients are the same as for the full DEM. Returns length, width and attributes. '''
+    atr = read_attributes(dem_file)
+    length, width = int(atr['FILE_LENGTH']), int(atr['WIDTH'])
+    strip_rows = get_strip_rows(120 * width, length, default_rows=length, looks=TILE_SIZE)
+    ls = LightSource(azdeg=azdeg, altdeg=altdeg)
+
+    def read_strip(r0, r1):
+        y0, y1 = max(r0 - 1, 0), min(r1 + 1, length)
+        dem, q = read_window(dem_file, None, [y0, y1, 0, width])
+        return dem, r0 - y0, dem.shape[0] - (y1 - r1)
+
+    strips = [[r0, min(r0 + strip_rows, length)] for r0 in range(0, length, strip_rows)]
+    vmax, imin, imax = -np.inf, np.inf, -np.inf
+    for r0, r1 in strips:
+        dem, i0, i1 = read_strip(r0, r1)
+        intensity = get_intensity(dem, ls, vert_exag)[i0:i1]
+        if np.isfinite(dem[i0:i1]).any():
+            vmax = max(vmax, np.nanmax(dem[i0:i1]))
+        if np.isfinite(intensity).any():
+            imin, imax = min(imin, np.nanmin(intensity)), max(imax, np.nanmax(intensity))
+    vmax = vmax + 2500
+
+    ny, nx = -(-length // TILE_SIZE), -(-width // TILE_SIZE)
+    tiles = np.lib.format.open_memmap(fname, mode='w+', dtype=np.uint8, shape=(ny, nx, TILE_SIZE, TILE_SIZE, 3))
+    for r0, r1 in strips:
+        dem, i0, i1 = read_strip(r0, r1)
+        intensity = get_intensity(dem, ls, vert_exag)[i0:i1]
+        if imax - imin > 1e-6:
+            intensity = (intensity - imin) / (imax - imin)
+        intensity = np.clip(intensity, 0, 1)[..., np.newaxis]
+        rgb = plt.cm.gray(Normalize(vmin=-20000, vmax=vmax)(dem[i0:i1]))[..., :3]
+        rgb = ls.blend_overlay(rgb, intensity) * 255
+        rgb[~np.isfinite(rgb).all(axis=-1)] = NODATA_COLOR       # NaN DEM pixels (e.g. borders of geocoded heights)
+        rgb = rgb.round().astype(np.uint8)
+        write_tile_rows(tiles, r0 // TILE_SIZE, rgb)
+    tiles.flush()
+    return length, width, atr
+
+def write_tile_rows(tiles, ty0, rgb):
+    ''' write the RGB image rows (a multiple of TILE_SIZE, or the last rows) into the tiles starting at tile row ty0 '''
+    ny = -(-rgb.shape[0] // TILE_SIZE)
+    nx = tiles.shape[1]
+    rgb = np.pad(rgb, ((0, ny * TILE_SIZE - rgb.shape[0]), (0, nx * TILE_SIZE - rgb.shape[1]), (0, 0)))
+    tiles[ty0:ty0 + ny] = rgb.reshape(ny, TILE_SIZE, nx, TILE_SIZE, 3).transpose(0, 2, 1, 3, 4)
+
+def reduce_tiles(fname, out_fname, length, width):
+    ''' next pyramid level of a tiled level, in strips of tile rows. Returns its length and width '''
+    tiles = np.load(fname, mmap_mode='r')
+    out_length, out_width = -(-length // 2), -(-width // 2)
+    ny, nx = -(-out_length // TILE_SIZE), -(-out_width // TILE_SIZE)
+    out = np.lib.format.open_memmap(out_fname, mode='w+', dtype=np.uint8, shape=(ny, nx, TILE_SIZE, TILE_SIZE, 3))
+    strip_rows = get_strip_rows(4 * 3 * 4 * width, length, default_rows=length, looks=2 * TILE_SIZE)
+    for r0 in range(0, length, strip_rows):
+        r1 = min(r0 + strip_rows, length)
+        write_tile_rows(out, r0 // 2 // TILE_SIZE, reduce_level(read_tiles(fname, [r0, r1, 0, width], tiles)))
+    out.flush()
+    return out_length, out_width
+
+def reduce_level(rgb):
+    ''' next pyramid level: mean of 2x2 blocks '''
+    length, width = rgb.shape[0], rgb.shape[1]
+    rgb = np.pad(rgb, ((0, length % 2), (0, width % 2), (0, 0)), mode='edge').astype(np.float32)
+    rgb = (rgb[0::2, 0::2] + rgb[1::2, 0::2] + rgb[0::2, 1::2] + rgb[1::2, 1::2]) / 4
+    return rgb.round().astype(np.uint8)
+
+def read_tiles(fname, window, tiles=None):
+    ''' read the window=[y0, y1, x0, x1] of a tiled RGB image, only the overlapping tiles are read '''
+    if tiles is None:
+        tiles = np.load(fname, mmap_mode='r')
+    y0, y1, x0, x1 = window
+    ty0, ty1 = y0 // TILE_SIZE, -(-y1 // TILE_SIZE)
+    tx0, tx1 = x0 // TILE_SIZE, -(-x1 // TILE_SIZE)
+    block = np.array(tiles[ty0:ty1, tx0:tx1])
+    block = block.transpose(0, 2, 1, 3, 4).reshape((ty1 - ty0) * TILE_SIZE, (tx1 - tx0) * TILE_SIZE, 3)
+    return block[y0 - ty0 * TILE_SIZE:y1 - ty0 * TILE_SIZE, x0 - tx0 * TILE_SIZE:x1 - tx0 * TILE_SIZE]
+
+@profile_stage('build_hillshade_pyramid')
+def build_hillshade_pyramid(dem_file, hillshade_dir, azdeg=315, altdeg=45, vert_exag=1.0):
+    ''' shade the full DEM once and store all pyramid levels '''
+    print('Building hillshade pyramid for', dem_file)
+    tmp_dir = hillshade_dir + '.' + str(os.getpid()) + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    length, width, atr = shade_strips(dem_file, tmp_dir + '/level0.npy', azdeg, altdeg, vert_exag)
+    levels = [[length, width]]
+    while max(length, width) > TILE_SIZE:
+        length, width = reduce_tiles(tmp_dir + '/level' + str(len(levels) - 1) + '.npy',
+                                     tmp_dir + '/level' + str(len(levels)) + '.npy', length, width)
+        levels.append([length, width])
+    meta = {key: atr[key] for key in ['Y_FIRST', 'X_FIRST', 'Y_STEP', 'X_STEP']}
+    meta['levels'] = levels
+    with open(tmp_dir + '/meta.json', 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp_dir, hillshade_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir)          # built concurrently by another process
+    return hillshade_dir
+
+def read_hillshade(dem_file, plot_box=None, num_pixels=1000, azdeg=315, altdeg=45, vert_exag=1.0):
+    ''' shaded relief (uint8 RGB) and extent of plot_box from the coarsest level with at least num_pixels across '''
+    hillshade_dir = get_hillshade_dir(dem_file, azdeg, altdeg, vert_exag)
+    if not os.path.isdir(hillshade_dir):
+        build_hillshade_pyramid(dem_file, hillshade_dir, azdeg, altdeg, vert_exag)
+    with open(hillshade_dir + '/meta.json') as f:
+        meta = json.load(f)
+
+    level = 0
+    for i, (length, width) in enumerate(meta['levels']):
+        atr = get_level_attributes(meta, i)
+        window = get_window(atr, plot_box, margin=2)
+        if window[3] - window[2] < num_pixels and i > 0:
+            break
+        level = i
+    atr = get_level_attributes(meta, level)
+    window = get_window(atr, plot_box, margin=2)
+    rgb = read_tiles(hillshade_dir + '/level' + str(level) + '.npy', window)
+    extent = get_dem_extent(crop_attributes(atr, window))
+    return rgb, extent
+
+def get_level_attributes(meta, level):
+    ''' geocoding attributes of a pyramid level '''
+    factor = 2**level
+    atr = {
+        'Y_FIRST': meta['Y_FIRST'],
+        'X_FIRST': meta['X_FIRST'],
+        'Y_STEP': str(float(meta['Y_STEP']) * factor),
+        'X_STEP': str(float(meta['X_STEP']) * factor),
+        'LENGTH': meta['levels'][level][0],
+        'WIDTH': meta['levels'][level][1],
+    }
+    return atr
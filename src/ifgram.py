@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+# Interferogram gallery: selection of date12 pairs of a MintPy geo_ifgramStack.h5 and one batch read of
+# their unwrapPhase inside the plot_box (the stack, mask and geometry files are opened once).
+import os
+import numpy as np
+import h5py
+from datetime import datetime
+from products import get_window, lalo2yx, crop_attributes
+from velocity import read_attributes
+from strips import get_looks, get_strip_rows, multilook, multilook_attributes
+
+def get_ifgram_files(eos_file):
+    ''' interferogram stack, mask and geometry files in the geo directory next to the HDF-EOS5 file '''
+    geo_dir = os.path.dirname(eos_file) + '/geo'
+    return geo_dir + '/geo_ifgramStack.h5', geo_dir + '/geo_maskTempCoh.h5', geo_dir + '/geo_geometryRadar.h5'
+
+def read_date12_list(f):
+    ''' date12 (YYYYMMDD_YYYYMMDD) of all interferograms of an open stack and the dropIfgram flags '''
+    date12_list = ['_'.join(date.decode('utf8') for date in dates) for dates in f['date'][:]]
+    keep = f['dropIfgram'][:] if 'dropIfgram' in f else np.ones(len(date12_list), dtype=bool)
+    return date12_list, keep
+
+def get_temporal_baseline(date12):
+    date1, date2 = [datetime.strptime(date, '%Y%m%d') for date in date12.split('_')]
+    return (date2 - date1).days
+
+def select_date12(date12_list, keep, date12=None, period=None, max_btemp=None):
+    ''' indices of the selected interferograms: the date12 list, else all kept pairs inside
+    period=[start_date, end_date] with temporal baseline of at most max_btemp days '''
+    if date12:
+        missing = [val for val in date12 if val not in date12_list]
+        if missing:
+            raise Exception('USER ERROR: interferograms not in stack: ' + ' '.join(missing))
+        return sorted(set(date12_list.index(val) for val in date12))
+    indices = []
+    for i, val in enumerate(date12_list):
+        date1, date2 = val.split('_')
+        if not keep[i]:
+            continue
+        if period and (date1 < period[0] or date2 > period[1]):
+            continue
+        if max_btemp and get_temporal_baseline(val) > max_btemp:
+            continue
+        indices.append(i)
+    if not indices:
+        raise Exception('USER ERROR: no interferograms selected')
+    return indices
+
+def read_ifgrams(ifgram_file, mask_file, plot_box=None, date12=None, period=None, max_btemp=None, reference_lalo=None):
+    ''' unwrapped interferograms (displacement in m, masked) of the selected pairs inside plot_box.
+    Returns dict of date12: (data, atr). The slices are read in one hyperslab per strip of rows. '''
+    with h5py.File(ifgram_file, 'r') as f:
+        atr = read_attributes(f)
+        atr['FILE_LENGTH'] = atr.get('FILE_LENGTH', atr['LENGTH'])
+        date12_list, keep = read_date12_list(f)
+        indices = select_date12(date12_list, keep, date12, period, max_btemp)
+        print(f'interferogram gallery: {len(indices)} of {len(date12_list)} interferograms')
+
+        dset = f['unwrapPhase']
+        y0, y1, x0, x1 = get_window(atr, plot_box)
+        looks = get_looks(y1 - y0, x1 - x0, num_arrays=len(indices))
+        strip_rows = get_strip_rows(8 * len(indices) * (x1 - x0), y1 - y0, looks=looks)
+        phase = np.empty((len(indices), -(-(y1 - y0) // looks), -(-(x1 - x0) // looks)), dtype=np.float32)
+        mask = None
+        if os.path.isfile(mask_file):
+            with h5py.File(mask_file, 'r') as fm:
+                mask = fm['mask'][y0:y1, x0:x1].astype(bool)
+        else:
+            print('interferogram gallery: no mask file', mask_file)
+        for r0 in range(y0, y1, strip_rows):
+            r1 = min(r0 + strip_rows, y1)
+            data = dset[indices, r0:r1, x0:x1].astype(np.float32)
+            if mask is not None:
+                data[:, ~mask[r0 - y0:r1 - y0]] = np.nan
+            for i in range(len(indices)):
+                phase[i, (r0 - y0) // looks:-(-(r1 - y0) // looks)] = multilook(data[i], looks)
+        if reference_lalo:
+            ref_y, ref_x = lalo2yx(atr, reference_lalo[0], reference_lalo[1])
+            phase -= dset[indices, ref_y, ref_x].astype(np.float32)[:, np.newaxis, np.newaxis]
+
+    # unwrapped phase (radian) to range change (m), MintPy convention
+    data = phase * -float(atr['WAVELENGTH']) / (4 * np.pi)
+    atr = multilook_attributes(crop_attributes(atr, [y0, y1, x0, x1]), looks)
+    atr['UNIT'] = 'm'
+    if reference_lalo:
+        atr['REF_LAT'], atr['REF_LON'] = str(reference_lalo[0]), str(reference_lalo[1])
+    ifgrams = {}
+    for i, index in enumerate(indices):
+        ifgrams[date12_list[index]] = (data[i], dict(atr, DATE12=date12_list[index]))
+    return ifgrams
+
+def get_common_vlim(data_list, percentile=98):
+    ''' symmetric color limits covering the percentile of all values '''
+    values = np.concatenate([np.abs(data[np.isfinite(data)]) for data in data_list])
+    vmax = float(np.percentile(values, percentile)) if values.size else 1.
+    return [-vmax, vmax]
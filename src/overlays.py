@@ -0,0 +1,164 @@
+#! /usr/bin/env python3
+# Overlays (fault lines, seismicity, GPS vectors) computed once per figure and drawn onto every axis.
+# Their inputs (fault file, earthquake catalog, GPS velocities) only depend on the options, plot_box and period
+# and can be prefetched in background threads while the InSAR data are prepared.
+import numpy as np
+from plot_functions import modify_colormap, add_colorbar
+from profiling import stage
+
+def read_fault_lines(line_file):
+    ''' fault polylines (lon, lat with NaN breaks) of the .mat file '''
+    import scipy.io as sio
+    lines = sio.loadmat(line_file, squeeze_me=True)
+    return lines['Lllh'][:, 0], lines['Lllh'][:, 1]
+
+def get_fault_lines(lon, lat, plot_box, num_pixels=1000):
+    ''' fault polylines clipped to plot_box and simplified to num_pixels across the box '''
+    lon = np.array(lon, dtype=np.float64)
+    lat = np.array(lat, dtype=np.float64)
+
+    # keep points inside plot_box and their neighbours (segments crossing the border), break lines elsewhere
+    pixel_size = [(plot_box[1] - plot_box[0]) / num_pixels, (plot_box[3] - plot_box[2]) / num_pixels]
+    inside = (lat >= plot_box[0] - pixel_size[0]) & (lat <= plot_box[1] + pixel_size[0]) & \
+             (lon >= plot_box[2] - pixel_size[1]) & (lon <= plot_box[3] + pixel_size[1])
+    keep = inside.copy()
+    keep[1:] |= inside[:-1]
+    keep[:-1] |= inside[1:]
+    lon[~keep] = np.nan
+    lat[~keep] = np.nan
+
+    # drop consecutive points in the same screen pixel and repeated NaN breaks
+    col = np.floor((lon - plot_box[2]) / pixel_size[1])
+    row = np.floor((lat - plot_box[0]) / pixel_size[0])
+    is_nan = np.isnan(lon) | np.isnan(lat)
+    same_pixel = np.zeros(len(lon), dtype=bool)
+    same_pixel[1:] = (col[1:] == col[:-1]) & (row[1:] == row[:-1])
+    repeated_nan = np.zeros(len(lon), dtype=bool)
+    repeated_nan[1:] = is_nan[1:] & is_nan[:-1]
+    keep = ~(same_pixel | repeated_nan)
+    return lon[keep], lat[keep]
+
+def get_overlay_key(inps, start_date, end_date, plot_box, num_pixels):
+    ''' key of the inputs the overlays depend on '''
+    options = ['line_file', 'flag_seismicity', 'fdsn_url', 'flag_offline', 'cmap_name', 'exclude_beginning', 'exclude_end',
+               'depth_range', 'mag_range', 'seismicity_mode', 'seismicity_max_events', 'seismicity_color',
+               'flag_gps', 'gps_dir', 'gps_list_file', 'gps_unit', 'gps_key_length', 'gps_ref_station']
+    key = [start_date, end_date, tuple(plot_box), num_pixels] + [getattr(inps, option, None) for option in options]
+    key.append(tuple(inps.reference_lalo) if inps.reference_lalo else None)
+    return tuple(key)
+
+def get_input_tasks(inps, start_date, end_date, plot_box):
+    ''' loaders of the overlay inputs as dict of name: (function, args, kwargs) '''
+    tasks = {}
+    if inps.line_file:
+        tasks['lines'] = (read_fault_lines, (inps.line_file,), {})
+    if inps.flag_seismicity:
+        from seismicity import get_earthquakes
+        tasks['seismicity'] = (get_earthquakes, (start_date, end_date, tuple(plot_box)),
+                               {'depth_range': inps.depth_range, 'mag_range': inps.mag_range, 'url': inps.fdsn_url,
+                                'offline': inps.flag_offline})
+    if inps.flag_gps:
+        from gps import get_gps
+        tasks['gps'] = (get_gps, (inps.gps_dir, inps.gps_list_file, tuple(plot_box), start_date, end_date, inps.gps_unit,
+                                  inps.gps_key_length),
+                        {'ref_site': inps.gps_ref_station, 'ref_lalo': tuple(inps.reference_lalo) if inps.reference_lalo else None})
+    return tasks
+
+def prefetch_overlays(inps):
+    ''' start loading the overlay inputs in background threads so that downloads and file parsing overlap with
+    the InSAR preparation. Needs the period and plot_box (the catalog and GPS inputs are skipped otherwise
+    and for interferograms, whose overlays are per pair). Returns dict of name: (task, future) for compute_overlays '''
+    from concurrent.futures import ThreadPoolExecutor
+    if inps.period and inps.plot_box and inps.plot_type != 'ifgram':
+        start_date, end_date = inps.period.split('-')
+        tasks = get_input_tasks(inps, start_date, end_date, inps.plot_box)
+    else:
+        tasks = {'lines': (read_fault_lines, (inps.line_file,), {})} if inps.line_file else {}
+    if not tasks:
+        return None
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='prefetch')
+    prefetch = {name: (task, executor.submit(task[0], *task[1], **task[2])) for name, task in tasks.items()}
+    executor.shutdown(wait=False)
+    return prefetch
+
+def load_overlay_inputs(inps, start_date, end_date, plot_box, prefetch=None):
+    ''' overlay inputs, taken from the prefetch if it was started with the same arguments '''
+    inputs = {}
+    for name, task in get_input_tasks(inps, start_date, end_date, plot_box).items():
+        if prefetch and name in prefetch and prefetch[name][0] == task:
+            with stage('wait_prefetch'):
+                inputs[name] = prefetch[name][1].result()
+        else:
+            inputs[name] = task[0](*task[1], **task[2])
+    return inputs
+
+def compute_overlays(inps, start_date, end_date, plot_box, num_pixels=1000, cache=None, prefetch=None):
+    ''' overlays for all axes of a figure. cache: dict of overlays already computed for the same inputs (batch runs),
+    prefetch: inputs loading in the background (prefetch_overlays) '''
+    if cache is not None:
+        key = get_overlay_key(inps, start_date, end_date, plot_box, num_pixels)
+        if key not in cache:
+            cache[key] = compute_overlays(inps, start_date, end_date, plot_box, num_pixels, prefetch=prefetch)
+        return cache[key]
+    inputs = load_overlay_inputs(inps, start_date, end_date, plot_box, prefetch)
+    overlays = {}
+    if 'lines' in inputs:
+        overlays['lines'] = get_fault_lines(*inputs['lines'], plot_box, num_pixels)
+    if 'seismicity' in inputs:
+        from seismicity import normalize_earthquake_times
+        events_df = inputs['seismicity']
+        # large catalogs as density image instead of one marker per event
+        mode = inps.seismicity_mode
+        if mode == 'auto':
+            mode = 'density' if events_df.shape[0] > inps.seismicity_max_events else 'scatter'
+        overlays['seismicity'] = {
+            'events_df': events_df,
+            'norm_times': normalize_earthquake_times(events_df, start_date, end_date),
+            'cmap': modify_colormap(cmap_name = inps.cmap_name, exclude_beginning = inps.exclude_beginning, exclude_end = inps.exclude_end, show = False),
+            'mode': mode,
+            'gridsize': max(20, num_pixels // 12),
+        }
+    if 'gps' in inputs:
+        gps,lon,lat,U,V,Z,quiver_label = inputs['gps']
+        overlays['gps'] = {'lon': lon, 'lat': lat, 'U': U, 'V': V, 'quiver_label': quiver_label}
+    return overlays
+
+def draw_seismicity(ax, seismicity, inps):
+    ''' events as markers (scatter), as markers rasterized in vector output (rasterized) or as hexagonal bins
+    colored by the mean time or the number of events (density) '''
+    events_df = seismicity['events_df']
+    if seismicity['mode'] == 'density':
+        extent = [inps.plot_box[2], inps.plot_box[3], inps.plot_box[0], inps.plot_box[1]] if inps.plot_box else None
+        if inps.seismicity_color == 'count':
+            bins = ax.hexbin(events_df["Longitude"], events_df["Latitude"], gridsize=seismicity['gridsize'], extent=extent,
+                             bins='log', mincnt=1, cmap='hot_r', alpha=0.8, linewidths=0)
+            cbar = ax.figure.colorbar(bins, ax=ax, shrink=0.8)
+            cbar.set_label('events', fontsize=inps.font_size)
+        else:
+            ax.hexbin(events_df["Longitude"], events_df["Latitude"], C=seismicity['norm_times'], reduce_C_function=np.mean,
+                      gridsize=seismicity['gridsize'], extent=extent, mincnt=1, cmap=seismicity['cmap'], vmin=0, vmax=1,
+                      alpha=0.8, linewidths=0)
+    else:
+        ax.scatter(events_df["Longitude"], events_df["Latitude"], s=2*events_df["Magnitude"] ** 3, c=seismicity['norm_times'],
+                   cmap=seismicity['cmap'], alpha=0.8, rasterized=seismicity['mode'] == 'rasterized')
+
+def draw_overlays(ax, overlays, inps, start_date, end_date, time_colorbar=True, font_size=12):
+    ''' draw the overlays onto ax '''
+    # plot fault lines
+    if 'lines' in overlays:
+        ax.plot(overlays['lines'][0], overlays['lines'][1], color='black', linestyle='dashed', linewidth=2)
+
+    # plot events
+    if 'seismicity' in overlays:
+        events_df = overlays['seismicity']['events_df']
+        cmap = overlays['seismicity']['cmap']
+        if not events_df.shape[0] == 0:
+            draw_seismicity(ax, overlays['seismicity'], inps)
+        if time_colorbar and not (overlays['seismicity']['mode'] == 'density' and inps.seismicity_color == 'count'):
+            add_colorbar(ax = ax, cmap = cmap, start_date = start_date, end_date = end_date)
+
+    if 'gps' in overlays:
+        gps = overlays['gps']
+        quiv=ax.quiver(gps['lon'], gps['lat'], gps['U'], gps['V'], scale = inps.gps_scale_fac, color='blue')
+        ax.quiverkey(quiv, -155.50, 19.57, inps.gps_key_length*10 , gps['quiver_label'], labelpos='N',coordinates='data',
+                     color='blue',fontproperties={'size': font_size})
@@ -1,17 +1,19 @@
 #! /usr/bin/env python3
 import os
-from mintpy.utils import readfile, writefile
-from matplotlib.colors import LinearSegmentedColormap, LightSource
+from matplotlib.colors import LinearSegmentedColormap
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
 from pathlib import Path
 from helper_functions import get_dem_extent
+from hillshade import read_hillshade
+from strips import multilook, multilook_attributes, get_display_looks_for_size
+from profiling import profile_stage
 
 def modify_colormap(cmap_name = "plasma_r", exclude_beginning = 0.15, exclude_end = 0.25, show = False):
     """ modify a colormap by excluding percentages at the beginning and end """
 
-    cmap = plt.cm.get_cmap(cmap_name)
+    cmap = plt.colormaps[cmap_name]
     cmap
 
     num_colors_to_exclude_beginning = int(len(cmap.colors) * exclude_beginning)
@@ -67,13 +69,62 @@ def get_step_size(plot_extent):
         rounded_step_size = 0.5
     return rounded_step_size
 
-def get_basemap(dem_file):
-    dem, atr_dem = readfile.read(dem_file)
-    dem_extent = get_dem_extent(atr_dem)
-    ls = LightSource(azdeg=315, altdeg=45)
-    dem_shade = ls.shade(dem, vert_exag=1.0, cmap=plt.cm.gray, vmin=-20000, vmax=np.nanmax(dem)+2500)
+@profile_stage('get_basemap')
+def get_basemap(dem_file, plot_box=None, num_pixels=1000):
+    # shaded relief of the plot_box from the cached hillshade pyramid
+    dem_shade, dem_extent = read_hillshade(dem_file, plot_box, num_pixels)
     return dem_shade,dem_extent
 
+UNIT_SCALES = {'km': 0.001, 'm': 1, 'dm': 10, 'cm': 100, 'mm': 1000}
+
+def get_unit_scale(unit):
+    """ scale factor from m and the length unit of unit (km, m, dm, cm, mm, also as mm/yr or mm/year) """
+    length_unit, _, time_unit = unit.partition('/')
+    if length_unit not in UNIT_SCALES or time_unit not in ['', 'yr', 'year']:
+        raise Exception('USER ERROR: unknown unit ' + unit + ' (km, m, dm, cm or mm, optionally with /yr or /year)')
+    return UNIT_SCALES[length_unit], length_unit
+
+def scale_to_unit(data, atr, unit, vlim=None):
+    """ data (in m or m/year) in unit (m, cm, mm), color limits (vlim or data range) and unit label like view.py """
+    scale, unit = get_unit_scale(unit)
+    data = data * scale
+    label = unit + '/year' if atr.get('UNIT', 'm/year').endswith('year') else unit
+    if vlim:
+        vmin, vmax = vlim
+    else:
+        vmin, vmax = np.nanmin(data), np.nanmax(data)
+    return data, vmin, vmax, label
+
+def get_display_looks(ax, atr, plot_box=None):
+    """ multilook factor so that the raster has about as many pixels across plot_box as the axis on the figure """
+    fig = ax.get_figure()
+    position = ax.get_position()
+    num_columns = position.width * fig.get_size_inches()[0] * fig.dpi
+    num_rows = position.height * fig.get_size_inches()[1] * fig.dpi
+    return get_display_looks_for_size(atr, plot_box, num_rows, num_columns)
+
+def plot_insar(ax, data, atr, inps):
+    """ plot velocity or displacement (in m or m/year) like view.py: jet colormap, unit, vlim, reference point.
+    The raster is multilooked to the display resolution of the axis. """
+    looks = get_display_looks(ax, atr, inps.plot_box)
+    data = multilook(data, looks)
+    atr = multilook_attributes(atr, looks)
+    data, vmin, vmax, unit = scale_to_unit(data, atr, inps.unit, inps.vlim)
+
+    extent = get_dem_extent(atr)
+    im = ax.imshow(data, origin='upper', cmap='jet', extent=extent, vmin=vmin, vmax=vmax, interpolation='nearest')
+    if inps.plot_box:
+        ax.set_xlim(inps.plot_box[2], inps.plot_box[3])
+        ax.set_ylim(inps.plot_box[0], inps.plot_box[1])
+    if 'REF_LAT' in atr:
+        ax.plot(float(atr['REF_LON']), float(atr['REF_LAT']), 'ks', markersize=6)
+
+    cbar = plt.colorbar(im, ax=ax, shrink=0.8)
+    cbar.set_label(unit, fontsize=inps.font_size)
+    cbar.ax.tick_params(labelsize=inps.font_size)
+    ax.tick_params(labelsize=inps.font_size)
+    return im
+
 def plot_shaded_relief(ax, dem_file, plot_box = []):
     
     factory_default_figsize = plt.rcParamsDefault['figure.figsize']
@@ -84,7 +135,9 @@ def plot_shaded_relief(ax, dem_file, plot_box = []):
         plt.rcParams['figure.figsize'] = new_default_figsize
 
     #plot DEM as background
-    dem_shade, dem_extent = get_basemap(dem_file);
+    # pyramid level matching the width of the axis in pixels
+    num_pixels = int(ax.get_position().width * ax.figure.get_size_inches()[0] * ax.figure.dpi)
+    dem_shade, dem_extent = get_basemap(dem_file, plot_box, num_pixels);
 
     ax.imshow(dem_shade, origin='upper', cmap=plt.cm.gray, extent=dem_extent)
     # ax.add_feature(cfeature.COASTLINE)
@@ -93,6 +146,8 @@ def plot_shaded_relief(ax, dem_file, plot_box = []):
        plot_extent = dem_extent          # x_min, x_max, y_min, y_max
     else:
        plot_extent = [plot_box[2], plot_box[3], plot_box[0], plot_box[1]]   
+       ax.set_xlim(plot_extent[0], plot_extent[1])
+       ax.set_ylim(plot_extent[2], plot_extent[3])
      
     # Add latitude and longitude labels to the plot
     step_size = get_step_size(plot_extent)
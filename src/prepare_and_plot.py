@@ -6,26 +6,27 @@
 # Output is  written into  `$SCRATCHDIR/MaunaLoa/SenDT87` and `$SCRATCHDIR/MaunaLoa/SenAT124`
 
 import os
-import matplotlib.pyplot as plt
-import scipy.io as sio
-from mintpy.utils import readfile, writefile
-from mintpy.defaults.plot import *
-from mintpy.view import prep_slice, plot_slice
-from mintpy.cli import reference_point, asc_desc2horz_vert, save_gdal, mask
+import copy
+import tempfile
+import numpy as np
 from helper_functions import get_file_names, get_data_type, get_plot_box
 from helper_functions import prepend_scratchdir_if_needed, find_nearest_start_end_date
-from helper_functions import  save_gbis_plotdata
-from plot_functions import plot_shaded_relief
-from plot_functions import modify_colormap, add_colorbar
-from seismicity import get_earthquakes, normalize_earthquake_times
-from gps import get_gps
-from insar import generate_view_velocity_cmd, generate_view_ifgram_cmd
+from helper_functions import  save_gbis_plotdata, get_cache_dir, get_sliding_windows
+from product_cache import get_product_key, lookup_product, store_product
+from velocity import estimate_velocity, sliding_window_velocity, read_date_list
+from products import read_coherence, mask_data, reference_data, read_product, write_product
+from products import read_attributes, read_window, get_window, get_point_window, read_geometry, crop_attributes
+from products import snap_window, crop_product, get_product_box, read_overview_window
+import profiling
+from profiling import stage, profile_stage, run_profiled, add_events
+from strips import set_max_memory, get_looks, process_strips, multilook_attributes, get_display_looks_for_size
 import subprocess
+from itertools import repeat
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-def run_prepare(inps):
-    # Prepare data for plotting
+def set_hardwired_options(inps):
     # Hardwired: move to argparse
-    inps.depth_range="0 10"
     inps.cmap_name = "plasma_r"; inps.exclude_beginning = 0.2; inps.exclude_end = 0.2
     
     # Hardwired for Hawaii
@@ -37,6 +38,16 @@ def run_prepare(inps):
     print('run_prepare: inps.gps_dir:' , inps.gps_dir)
     inps.gps_list_file = inps.gps_dir + '/GPS_BenBrooks_03-05full.txt'
 
+def start_prefetch(inps):
+    # Start loading fault lines, earthquakes and GPS in background threads, concurrently with run_prepare
+    from overlays import prefetch_overlays
+    return prefetch_overlays(inps)
+
+@profile_stage('run_prepare')
+def run_prepare(inps):
+    # Prepare data for plotting
+    set_max_memory(inps.max_memory)
+
     data_dir = inps.data_dir
     dem_file =  inps.dem_file
     if inps.dem_file:
@@ -46,89 +57,324 @@ def run_prepare(inps):
 
     plot_type = inps.plot_type
     reference_lalo = inps.reference_lalo
-    mask_vmin = inps.mask_vmin
-    flag_save_gbis =  inps.flag_save_gbis
     if inps.period:
         period = [val for val in inps.period.split('-')]      # converts to period=['20220101', '20221101']
         start_date = period[0]
         end_date = period[1]
 
+    # cache for prepared products (skips timeseries2velocity, masking and referencing if inputs did not change)
+    product_cache_dir = None if inps.flag_no_cache else get_cache_dir('products')
+
     # calculate velocities for periods of interest
     data_dict = {}
     if plot_type == 'velocity' or plot_type == 'horzvert':
-        for dir in data_dir:
-            work_dir = prepend_scratchdir_if_needed(dir)
-            eos_file, q, q, q, out_geo_vel_file = get_file_names(work_dir)
-            temp_coh_file=out_geo_vel_file.replace('velocity.h5','temporalCoherence.tif')
-            start_date, end_date = find_nearest_start_end_date(eos_file, period)
-            # get masked geo_velocity.h5 with MintPy
-            # cmd = f'{eos_file} --start-date {start_date_mod} --end-date {end_date_mod} --output {out_geo_vel_file}'
-            # timeseries2velocity.main( cmd.split() )
-            cmd = f'{eos_file} --start-date {start_date} --end-date {end_date} --output {out_geo_vel_file}'
-            cmd =['timeseries2velocity.py'] + cmd.split()
-            output = subprocess.check_output(cmd)
-            #print(output.decode())
-            cmd = f'{eos_file} --dset temporalCoherence --output {temp_coh_file}'
-            save_gdal.main( cmd.split() )
-            cmd = f'{out_geo_vel_file} --mask {temp_coh_file} --mask-vmin { mask_vmin} --outfile {out_geo_vel_file}'
-            mask.main( cmd.split() )
-            if reference_lalo:
-                cmd = f'{out_geo_vel_file} --lat {reference_lalo[0]} --lon {reference_lalo[1]}'
-                reference_point.main( cmd.split() )
-            if flag_save_gbis:
-                save_gbis_plotdata(eos_file, out_geo_vel_file, start_date, end_date)
-            data_dict[out_geo_vel_file] = {
-            'start_date': start_date,
-            'end_date': end_date
-            }
+        # tracks are independent until the decomposition: prepare them in parallel worker processes
+        # (started by a fork server, forking this process is not safe while the overlay prefetch threads run)
+        if inps.jobs > 1 and len(data_dir) > 1:
+            with ProcessPoolExecutor(max_workers=min(inps.jobs, len(data_dir)), mp_context=multiprocessing.get_context('forkserver')) as executor:
+                if profiling.enabled:
+                    # --profile: the workers return their stages with the results, merged into the trace of this process
+                    results = []
+                    for result, worker_events in executor.map(run_profiled, repeat(profiling.start_epoch), repeat(prepare_velocity),
+                                                              data_dir, repeat(inps), repeat(product_cache_dir)):
+                        add_events(worker_events)
+                        results.append(result)
+                else:
+                    results = list(executor.map(prepare_velocity, data_dir, repeat(inps), repeat(product_cache_dir)))
+        else:
+            results = [prepare_velocity(dir, inps, product_cache_dir) for dir in data_dir]
+        for out_geo_vel_file, dict in results:
+            data_dict[out_geo_vel_file] = dict
     elif plot_type == 'step':
         for dir in data_dir:
             work_dir = prepend_scratchdir_if_needed(dir)
             eos_file, geo_vel_file, geo_geometry_file, out_dir, out_geo_vel_file = get_file_names(work_dir)
-            geo_step, atr = readfile.read(geo_vel_file, datasetName='step20210306')
+            file_atr = read_attributes(geo_vel_file)
+            window = get_window(file_atr, inps.plot_box)
+            with stage('read_step'):
+                geo_step, atr = read_window(geo_vel_file, 'step20210306', window, looks=get_looks(window[1] - window[0], window[3] - window[2]))
             out_geo_step_file = out_geo_vel_file.replace('velocity','step')
-            writefile.write(geo_step, out_file=out_geo_step_file, metadata=atr)
             if reference_lalo:
-                cmd = f'{out_geo_step_file} --lat {reference_lalo[0]} --lon {reference_lalo[1]}'
-                reference_point.main( cmd.split() )
+                ref_step, q = read_window(geo_vel_file, 'step20210306', get_point_window(file_atr, reference_lalo))
+                geo_step, atr = reference_data(geo_step, atr, reference_lalo, ref_value=ref_step[0, 0])
+            if inps.flag_save_products:
+                write_product(out_geo_step_file, geo_step, atr, dset_name='step')
             data_dict[out_geo_step_file] = {
             'start_date': atr['mintpy.timeFunc.stepDate'],
-            'end_date': atr['mintpy.timeFunc.stepDate']
+            'end_date': atr['mintpy.timeFunc.stepDate'],
+            'data': geo_step,
+            'atr': atr
             }
+    elif plot_type == 'ifgram':
+        for dir in data_dir:
+            data_dict.update(prepare_ifgrams(dir, inps))
     elif plot_type == 'shaded-relief':
         data_dict[dem_file] = {
         'start_date': start_date,
         'end_date': end_date
         }
  
-    # calculate horizontal and vertical
+    # calculate horizontal and vertical (or east, north, up) on the common grid of the tracks inside plot_box
     if  plot_type == 'horzvert':
-        data_dict = {}
-        q, q, q, q, out_geo_vel_file0 = get_file_names( prepend_scratchdir_if_needed(data_dir[0]) )
-        q, q, q, q, out_geo_vel_file1 = get_file_names( prepend_scratchdir_if_needed(data_dir[1]) )
-        
-        cmd = f'{out_geo_vel_file0} {out_geo_vel_file1}'
-        asc_desc2horz_vert.main( cmd.split() )
-        data_dict['up.h5'] = {'start_date': start_date, 'end_date': end_date}
-        data_dict['hz.h5'] = {'start_date': start_date, 'end_date': end_date}
+        data_dict = run_decomposition(data_dict, inps)
     
     if inps.plot_box is None:
         inps.plot_box = get_plot_box(data_dict)
+
+    # tiled, compressed products with overviews for GIS and web viewers
+    if inps.export_format:
+        from export import export_products
+        with stage('export'):
+            export_products(data_dict, inps.export_format, inps.export_dir)
     
     return data_dict
 
-def run_plot(data_dict, inps):
+@profile_stage('decompose')
+def run_decomposition(data_dict, inps):
+    # Decompose the velocities of all tracks, returns data_dict with one entry per component
+    from decomposition import COMPONENTS, get_common_grid, resample_to_grid, decompose
+    tracks = list(data_dict.values())
+    first_file = next(iter(data_dict))
+    start_date = tracks[0]['start_date']
+    end_date = tracks[0]['end_date']
+
+    grid_atr = get_common_grid([track['atr'] for track in tracks], inps.plot_box)
+    los_list, incidence_list, azimuth_list, weight_list = [], [], [], []
+    for track in tracks:
+        los_list.append(resample_to_grid(track['data'], track['atr'], grid_atr))
+        incidence_list.append(resample_to_grid(track['incidence'], track['atr'], grid_atr))
+        azimuth_list.append(resample_to_grid(track['azimuth'], track['atr'], grid_atr))
+        weight_list.append(resample_to_grid(track['coherence'], track['atr'], grid_atr))
+    solution = decompose(los_list, incidence_list, azimuth_list, weight_list,
+                         components=inps.horzvert_components, horz_az=inps.horz_az)
+
+    # products are named after the project (e.g. MaunaLoa/up.h5); files are only written with --save-products
+    project_base_dir = os.path.dirname(os.path.dirname(first_file))
+    data_dict = {}
+    for name, data in zip(COMPONENTS[inps.horzvert_components], solution):
+        file = project_base_dir + '/' + name + '.h5'
+        atr = grid_atr.copy()
+        if inps.flag_save_products:
+            write_product(file, data, atr)
+        data_dict[file] = {'start_date': start_date, 'end_date': end_date, 'data': data, 'atr': atr}
+    return data_dict
+
+@profile_stage('prepare_ifgrams')
+def prepare_ifgrams(dir, inps):
+    # Selected interferograms of one track (read as one batch) with the shaded relief of its geometry file
+    from ifgram import get_ifgram_files, read_ifgrams
+    from hillshade import read_hillshade
+    work_dir = prepend_scratchdir_if_needed(dir)
+    eos_file, geo_vel_file, geo_geometry_file, out_dir, out_geo_vel_file = get_file_names(work_dir)
+    ifgram_file, mask_file, geometry_file = get_ifgram_files(eos_file)
+    period = inps.period.split('-') if inps.period else None
+    with stage('read_ifgrams'):
+        ifgrams = read_ifgrams(ifgram_file, mask_file, inps.plot_box, inps.date12, period, inps.max_btemp, inps.reference_lalo)
+    basemap = read_hillshade(geometry_file, inps.plot_box) if os.path.isfile(geometry_file) else None
+    data_dict = {}
+    for date12, (data, atr) in ifgrams.items():
+        data_dict[ifgram_file + ':unwrapPhase-' + date12] = {
+        'start_date': date12.split('_')[0],
+        'end_date': date12.split('_')[1],
+        'data': data,
+        'atr': atr,
+        'basemap': basemap,
+        'out_dir': out_dir,
+        'track': os.path.basename(os.path.dirname(out_geo_vel_file))
+        }
+    return data_dict
+
+@profile_stage('prepare_velocity')
+def prepare_velocity(dir, inps, product_cache_dir=None):
+    # Prepare masked and referenced velocity of one track (runs in worker processes for --jobs)
+    reference_lalo = inps.reference_lalo
+    mask_vmin = inps.mask_vmin
+    set_max_memory(inps.max_memory)
+    work_dir = prepend_scratchdir_if_needed(dir)
+    eos_file, q, q, q, out_geo_vel_file = get_file_names(work_dir)
+    start_date, end_date = find_nearest_start_end_date(eos_file, inps.period)
+    # read only the plot_box (plus margin) and the reference pixel, multilooked if it does not fit into --max-memory
+    eos_atr = read_attributes(eos_file)
+    window = get_window(eos_atr, inps.plot_box)
+    num_arrays = 4 if inps.plot_type == 'horzvert' else 1
+    if reference_lalo:
+        ref_window = get_point_window(eos_atr, reference_lalo)
+    cached_file = None
+    if product_cache_dir:
+        # the cache holds the product of the whole scene (other --plot-box values are cache hits), cropped to the window
+        process_window = get_window(eos_atr, None)
+        looks = get_looks(process_window[1], process_window[3], num_arrays=num_arrays)
+        window = snap_window(window, looks, process_window)
+        cache_key, cache_params = get_product_key(eos_file, start_date, end_date, mask_vmin, reference_lalo,
+                                                  velocity_engine=inps.velocity_engine, looks=looks)
+        if not inps.flag_refresh:
+            cached_file = lookup_product(product_cache_dir, cache_key)
+    else:
+        process_window = window
+        looks = get_looks(window[1] - window[0], window[3] - window[2], num_arrays=num_arrays)
+    overview = None
+    if cached_file:
+        print('Using cached product:', cached_file)
+        if inps.plot_type == 'velocity' and not (inps.flag_save_products or inps.flag_save_gbis or inps.export_format):
+            # only displayed: read the coarsest overview level that still has the display resolution
+            cached_atr = read_attributes(cached_file)
+            num_rows, num_columns = get_axis_pixels(len(inps.data_dir))
+            display_looks = get_display_looks_for_size(cached_atr, inps.plot_box, num_rows, num_columns)
+            overview = read_overview_window(cached_file, cached_atr, get_product_box(window, looks), display_looks)
+        if overview:
+            velocity, atr = overview
+            print('Using overview of cached product:', atr['LENGTH'], 'x', atr['WIDTH'], 'pixels')
+        else:
+            velocity, atr = read_product(cached_file, dset_name='velocity')
+    else:
+        # masked with temporal coherence strip by strip (before multilooking)
+        if inps.velocity_engine == 'native':
+            with stage('estimate_velocity'):
+                velocity, atr = estimate_velocity(eos_file, start_date, end_date, window=process_window, mask_vmin=mask_vmin, looks=looks)
+                if reference_lalo:
+                    ref_velocity, q = estimate_velocity(eos_file, start_date, end_date, window=ref_window)
+        else:
+            with stage('timeseries2velocity'), tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_vel_file = tmp_dir + '/geo_velocity.h5'
+                cmd = f'{eos_file} --start-date {start_date} --end-date {end_date} --output {tmp_vel_file}'
+                if inps.max_memory:
+                    cmd += f' --memory {inps.max_memory}'
+                cmd =['timeseries2velocity.py'] + cmd.split()
+                output = subprocess.check_output(cmd)
+                #print(output.decode())
+
+                def read_strip(r0, r1):
+                    strip = [r0, r1, process_window[2], process_window[3]]
+                    return mask_data(read_window(tmp_vel_file, 'velocity', strip)[0], read_coherence(eos_file, strip), mask_vmin)
+
+                velocity = process_strips(read_strip, process_window, row_bytes=16 * (process_window[3] - process_window[2]), looks=looks)
+                atr = multilook_attributes(crop_attributes(read_attributes(tmp_vel_file), process_window), looks)
+                if reference_lalo:
+                    ref_velocity, q = read_window(tmp_vel_file, 'velocity', ref_window)
+        # reference in memory
+        with stage('mask_and_reference'):
+            if reference_lalo:
+                ref_velocity = mask_data(ref_velocity, read_coherence(eos_file, ref_window), mask_vmin)
+                velocity, atr = reference_data(velocity, atr, reference_lalo, ref_value=ref_velocity[0, 0])
+        if product_cache_dir:
+            with stage('store_product'):
+                store_product(product_cache_dir, cache_key, cache_params, velocity, atr, inps.cache_size)
+    if product_cache_dir and not overview:
+        velocity, atr = crop_product(velocity, atr, window, looks)
+    if inps.flag_save_products:
+        write_product(out_geo_vel_file, velocity, atr)
+    if inps.flag_save_gbis:
+        save_gbis_plotdata(eos_file, out_geo_vel_file, start_date, end_date, inps.velocity_engine)
+    dict = {
+    'start_date': start_date,
+    'end_date': end_date,
+    'data': velocity,
+    'atr': atr
+    }
+    if inps.plot_type == 'horzvert':
+        dict['incidence'], dict['azimuth'] = read_geometry(eos_file, window, looks)
+        dict['coherence'] = read_coherence(eos_file, window, looks)
+    return out_geo_vel_file, dict
+
+@profile_stage('run_sliding_window')
+def run_sliding_window(inps):
+    # Velocity maps for consecutive windows (--sliding-window LEN:STEP), rendered to an image sequence and GIF
+    window_length, window_step = inps.sliding_window
+
+    eos_files = []
+    for dir in inps.data_dir:
+        work_dir = prepend_scratchdir_if_needed(dir)
+        eos_file, q, q, q, out_geo_vel_file = get_file_names(work_dir)
+        eos_files.append((eos_file, out_geo_vel_file))
+
+    # windows of the period of the first track with at least 2 dates in all tracks
+    start_date, end_date = find_nearest_start_end_date(eos_files[0][0], inps.period)
+    windows = get_sliding_windows(start_date, end_date, window_length, window_step)
+    for eos_file, q in eos_files:
+        date_list = read_date_list(eos_file)
+        windows = [[start, end] for start, end in windows if sum(start <= date <= end for date in date_list) >= 2]
+    if not windows:
+        raise Exception('USER ERROR: no sliding window with at least 2 dates in ' + start_date + '-' + end_date)
+
+    tracks = []
+    for eos_file, out_geo_vel_file in eos_files:
+        eos_atr = read_attributes(eos_file)
+        window = get_window(eos_atr, inps.plot_box)
+        coherence = read_coherence(eos_file, window)
+        reference_yx = None
+        if inps.reference_lalo:
+            ref_window = get_point_window(eos_atr, inps.reference_lalo)
+            if read_coherence(eos_file, ref_window)[0, 0] < inps.mask_vmin:
+                raise Exception('USER ERROR: reference point is masked: ' + str(inps.reference_lalo))
+            reference_yx = [ref_window[0], ref_window[2]]
+        tracks.append((eos_file, out_geo_vel_file, coherence, window, reference_yx))
+
+    def get_frame_dicts(windows):
+        # data_dict of every window, computed window by window for all tracks
+        frames = [sliding_window_velocity(eos_file, windows, window=window, reference_yx=reference_yx)
+                  for eos_file, q, q, window, reference_yx in tracks]
+        for frame in zip(*frames):
+            data_dict = {}
+            for (q, out_geo_vel_file, coherence, q, q), (start_date, end_date, velocity, atr) in zip(tracks, frame):
+                velocity = mask_data(velocity, coherence, inps.mask_vmin)
+                if inps.reference_lalo:
+                    velocity, atr = reference_data(velocity, atr, inps.reference_lalo, ref_value=0.)
+                data_dict[out_geo_vel_file] = {'start_date': start_date, 'end_date': end_date, 'data': velocity, 'atr': atr}
+            yield data_dict
+
+    # same color limits for the whole sequence, from a sample of up to num_sample frames
+    inps = copy.copy(inps)
+    num_sample = 10
+    if not inps.vlim:
+        sample_windows = windows[::-(-len(windows) // num_sample)]
+        vmax = 0.
+        for data_dict in get_frame_dicts(sample_windows):
+            vmax = max([vmax] + [np.nanpercentile(np.abs(entry['data']), 98) for entry in data_dict.values()])
+        from plot_functions import scale_to_unit
+        inps.vlim = scale_to_unit(np.array([-vmax, vmax]), {}, inps.unit)[0].tolist()
+
+    # frames are rendered as they are computed
+    out_dir = os.path.dirname(tracks[0][1]) + '/sliding_window_' + inps.sliding_window_str.replace(':', '_')
+    os.makedirs(out_dir, exist_ok=True)
+    frame_files = []
+    for i, data_dict in enumerate(get_frame_dicts(windows)):
+        if inps.plot_box is None:
+            inps.plot_box = get_plot_box(data_dict)
+        frame_inps = copy.copy(inps)
+        frame_inps.period = windows[i][0] + '-' + windows[i][1]
+        frame_files.append(out_dir + f'/frame_{i:03d}.png')
+        run_plot(data_dict, frame_inps, outfile=frame_files[-1])
+    print('sliding window: wrote', len(frame_files), 'frames to', out_dir)
+
+    from PIL import Image
+    Image.open(frame_files[0]).save(out_dir + '/sliding_window.gif', save_all=True,
+                                    append_images=(Image.open(file) for file in frame_files[1:]), duration=500, loop=0)
+    print('sliding window: wrote', out_dir + '/sliding_window.gif')
+    return frame_files
+
+def get_figsize(num_panels):
+    # size (inches) of the run_plot figure with num_panels axes in one row
+    return [12, 5] if num_panels == 1 else [6*num_panels, 5]
+
+def get_axis_pixels(num_panels, dpi=100):
+    # rows and columns of pixels of one axis of the run_plot figure (default dpi and subplot parameters)
+    width, height = get_figsize(num_panels)
+    num_columns = 0.775 * width * dpi / (num_panels + 0.2 * (num_panels - 1))
+    num_rows = 0.77 * height * dpi
+    return num_rows, num_columns
+
+@profile_stage('run_plot')
+def run_plot(data_dict, inps, outfile=None, overlay_cache=None, prefetch=None):
+    # outfile: save the figure (headless) instead of showing it
+    # overlay_cache: dict for reusing overlays of previous figures with the same inputs
+    # prefetch: overlay inputs loading in the background (start_prefetch)
+    import matplotlib.pyplot as plt
+    from plot_functions import plot_shaded_relief, plot_insar
+    from overlays import compute_overlays, draw_overlays
+    inps = copy.copy(inps)
 
-    gps_dir = inps.gps_dir
-    gps_list_file = inps.gps_list_file
     plot_box = inps.plot_box
-    flag_seismicity = inps.flag_seismicity
-    flag_gps = inps.flag_gps
     plot_type = inps.plot_type
-    line_file = inps.line_file
-    gps_scale_fac = inps.gps_scale_fac
-    gps_key_length = inps.gps_key_length
-    gps_unit = inps.gps_unit
     font_size = inps.font_size
     if inps.period:
         period = [val for val in inps.period.split('-')]      # converts to period=['20220101', '20221101']
@@ -137,53 +383,64 @@ def run_plot(data_dict, inps):
     else:
         start_date = data_dict[next(iter(data_dict))]['start_date']
         end_date = data_dict[next(iter(data_dict))]['end_date']
-    cmap_name = inps.cmap_name
-    exclude_beginning = inps.exclude_beginning
-    exclude_end = inps.exclude_end
 
-    # initialize plot
-    if len(data_dict) == 2:
-        fig, axes = plt.subplots(1, 2, figsize=[12, 5] )
+    # initialize plot (interferograms as gallery with common color limits)
+    if plot_type == 'ifgram':
+        from ifgram import get_common_vlim
+        from plot_functions import scale_to_unit
+        num_columns = inps.gallery_columns or int(np.ceil(np.sqrt(len(data_dict))))
+        num_rows = -(-len(data_dict) // num_columns)
+        fig, axes = plt.subplots(num_rows, num_columns, figsize=[4*num_columns, 3.5*num_rows], squeeze=False)
+        for ax in axes.flat[len(data_dict):]:
+            ax.axis('off')
+        axes = axes.flatten()
+        inps.font_size = int(inps.font_size*0.7)
+        if not inps.vlim:
+            inps.vlim = get_common_vlim([scale_to_unit(dict['data'], dict['atr'], inps.unit)[0] for dict in data_dict.values()])
+    elif len(data_dict) > 1:
+        num_columns = len(data_dict)
+        fig, axes = plt.subplots(1, len(data_dict), figsize=get_figsize(len(data_dict)))
         inps.font_size = int(inps.font_size*0.7)  
     else:
-        fig, axes = plt.subplots(figsize=[12, 5] )
+        num_columns = 1
+        fig, axes = plt.subplots(figsize=get_figsize(1))
         axes = [axes] 
+
+    # overlays are the same for all axes (except for interferograms): compute once, fault lines simplified to the axis width in pixels
+    num_pixels = int(fig.get_size_inches()[0] * fig.dpi / num_columns)
+    if plot_type != 'ifgram':
+        with stage('compute_overlays'):
+            overlays = compute_overlays(inps, start_date, end_date, plot_box, num_pixels, cache=overlay_cache, prefetch=prefetch)
         
     for i, (file, dict) in enumerate(data_dict.items()):
         
         if plot_type == 'velocity' or plot_type == 'horzvert' or plot_type == 'ifgram' or plot_type == 'step':
             if plot_type == 'velocity' or plot_type == 'horzvert' or plot_type == 'step':
-                cmd = generate_view_velocity_cmd(file, inps) 
+                with stage('plot_insar'):
+                    plot_insar(axes[i], dict['data'], dict['atr'], inps)
             elif plot_type == 'ifgram':
-                cmd = generate_view_ifgram_cmd(work_dir, date12, inps)
-            data, atr, tmp_inps = prep_slice(cmd)
-            q0, q1, q2, q3 = plot_slice(axes[i], data, atr, tmp_inps)
+                with stage('plot_ifgram'):
+                    if dict['basemap'] is not None:
+                        axes[i].imshow(dict['basemap'][0], extent=dict['basemap'][1], origin='upper', interpolation='nearest')
+                    plot_insar(axes[i], dict['data'], dict['atr'], inps)
+                # overlays of the period of the interferogram
+                with stage('compute_overlays'):
+                    overlays = compute_overlays(inps, dict['start_date'], dict['end_date'], plot_box, num_pixels, cache=overlay_cache, prefetch=prefetch)
+                start_date, end_date = dict['start_date'], dict['end_date']
         elif plot_type == 'shaded-relief':
-            plot_shaded_relief(axes[i], file, plot_box = plot_box)
+            with stage('plot_shaded_relief'):
+                plot_shaded_relief(axes[i], file, plot_box = plot_box)
      # plot title
         data_type = get_data_type(file)
         axes[i].set_title(data_type + ': ' + dict['start_date'] + ' - ' + dict['end_date']);
      
-        # plot fault lines
-        if line_file:
-            lines=sio.loadmat(line_file,squeeze_me=True);
-            axes[i].plot(lines['Lllh'][:,0],lines['Lllh'][:,1],color='black', linestyle='dashed',linewidth=2)
-     
-        # plot events
-        if flag_seismicity:
-            events_df = get_earthquakes(start_date, end_date, plot_box)
-            norm_times = normalize_earthquake_times(events_df, start_date, end_date)
-            cmap = modify_colormap( cmap_name = cmap_name, exclude_beginning = exclude_beginning, exclude_end = exclude_end, show = False)
-            if not events_df.shape[0] == 0:
-                axes[i].scatter(events_df["Longitude"],events_df["Latitude"],s=2*events_df["Magnitude"] ** 3, c=norm_times,cmap=cmap,alpha=0.8)
-            # plot scale only if there is only one plot (if there are no two plots)
-            if  not ( len(data_dict.items()) == 2):
-                add_colorbar(ax = axes[i], cmap = cmap, start_date = start_date, end_date = end_date)
-        
-        if flag_gps:
-            gps,lon,lat,U,V,Z,quiver_label = get_gps(gps_dir, gps_list_file, plot_box, start_date, end_date, gps_unit, inps.gps_key_length)
-            (gps_dir, gps_list_file, plot_box, start_date, end_date, gps_unit, gps_key_length)
-            quiv=axes[i].quiver(lon, lat, U, V, scale = gps_scale_fac, color='blue')
-            axes[i].quiverkey(quiv, -155.50, 19.57, gps_key_length*10 , quiver_label, labelpos='N',coordinates='data',
-                              color='blue',fontproperties={'size': font_size}) 
-    plt.show()
+        # plot fault lines, events and GPS (time colorbar only if there is only one plot)
+        with stage('draw_overlays'):
+            draw_overlays(axes[i], overlays, inps, start_date, end_date, time_colorbar=len(data_dict) == 1, font_size=font_size)
+    if outfile:
+        with stage('savefig'):
+            fig.savefig(outfile, dpi=fig.dpi, bbox_inches='tight')
+        plt.close(fig)
+    else:
+        with stage('show'):                    # includes the time the window is open
+            plt.show()
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# Persistent cache for prepared InSAR products (e.g. masked, referenced geo_velocity.h5).
+# Each product is stored as <key>.h5 with its overview sidecar <key>.ovr.h5, next to a small <key>.json
+# describing the inputs. The modification time of the json file is used as last-access time for LRU
+# eviction (the product's own must not change, it validates the overviews), so no shared index has to be
+# kept consistent between concurrent runs.
+import os
+import json
+import time
+import hashlib
+from products import write_product, write_overviews, get_overview_file
+
+def get_product_key(eos_file, start_date, end_date, mask_vmin, reference_lalo, **kwargs):
+    ''' key from input file identity (path, size, mtime) and the processing parameters '''
+    stat = os.stat(eos_file)
+    params = {
+        'eos_file': os.path.abspath(eos_file),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'start_date': start_date,
+        'end_date': end_date,
+        'mask_vmin': mask_vmin,
+        'reference_lalo': list(reference_lalo) if reference_lalo else None,
+    }
+    params.update(kwargs)
+    key = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return key, params
+
+def lookup_product(cache_dir, key):
+    ''' return cached product file for key (and mark it as recently used) or None '''
+    cached_file = cache_dir + '/' + key + '.h5'
+    if not os.path.isfile(cached_file):
+        return None
+    try:
+        os.utime(cache_dir + '/' + key + '.json')
+    except FileNotFoundError:
+        pass
+    return cached_file
+
+def store_product(cache_dir, key, params, data, atr, max_size_gb, dset_name='velocity'):
+    ''' write product into the cache and evict least recently used products above max_size_gb '''
+    cached_file = cache_dir + '/' + key + '.h5'
+    tmp_file = cache_dir + '/' + key + '.' + str(os.getpid()) + '.tmp.h5'
+    write_product(tmp_file, data, atr, dset_name=dset_name, overviews=False)
+    os.replace(tmp_file, cached_file)
+    write_overviews(cached_file, data)
+    with open(cache_dir + '/' + key + '.json', 'w') as f:
+        json.dump(params, f, indent=2)
+    evict_products(cache_dir, max_size_gb, keep=cached_file)
+    return cached_file
+
+def evict_products(cache_dir, max_size_gb, keep=None):
+    ''' remove least recently used products until the cache is smaller than max_size_gb '''
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.h5') or name.endswith('.tmp.h5') or name.endswith('.ovr.h5'):
+            continue
+        file = cache_dir + '/' + name
+        try:
+            size = os.stat(file).st_size
+            mtime = os.stat(file.replace('.h5', '.json')).st_mtime
+            if os.path.isfile(get_overview_file(file)):
+                size += os.stat(get_overview_file(file)).st_size
+        except FileNotFoundError:
+            continue
+        entries.append((mtime, size, file))
+
+    total_size = sum(entry[1] for entry in entries)
+    max_size = max_size_gb * 1024**3
+    for mtime, size, file in sorted(entries):
+        if total_size <= max_size:
+            break
+        if file == keep:
+            continue
+        print('product cache: evicting', os.path.basename(file), 'last used', time.ctime(mtime))
+        for fname in [file, get_overview_file(file), file.replace('.h5', '.json')]:
+            if os.path.exists(fname):
+                os.remove(fname)
+        total_size -= size
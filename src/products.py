@@ -0,0 +1,215 @@
+#! /usr/bin/env python3
+# In-memory operations on prepared InSAR products (2D numpy array plus MintPy attributes)
+import os
+import numpy as np
+import h5py
+from strips import process_strips, multilook, multilook_attributes
+
+EOS_COHERENCE_DSET = 'HDFEOS/GRIDS/timeseries/quality/temporalCoherence'
+EOS_GEOMETRY_GROUP = 'HDFEOS/GRIDS/timeseries/geometry'
+
+def read_coherence(eos_file, window=None, looks=1):
+    ''' temporal coherence from the HDF-EOS5 file (window=[y0, y1, x0, x1]), multilooked by looks '''
+    with h5py.File(eos_file, 'r') as f:
+        dset = f[EOS_COHERENCE_DSET]
+        y0, y1, x0, x1 = window if window else [0, dset.shape[0], 0, dset.shape[1]]
+        if looks == 1:
+            return dset[y0:y1, x0:x1]
+        return process_strips(lambda r0, r1: dset[r0:r1, x0:x1], [y0, y1, x0, x1], row_bytes=8 * (x1 - x0), looks=looks)
+
+def read_geometry(eos_file, window=None, looks=1):
+    ''' incidence and azimuth angle (degrees, MintPy convention) from the HDF-EOS5 file (window=[y0, y1, x0, x1]),
+    multilooked by looks. Without azimuthAngle dataset the azimuth angle is calculated from the HEADING attribute. '''
+    with h5py.File(eos_file, 'r') as f:
+        group = f[EOS_GEOMETRY_GROUP]
+        y0, y1, x0, x1 = window if window else [0, group['incidenceAngle'].shape[0], 0, group['incidenceAngle'].shape[1]]
+        incidence = process_strips(lambda r0, r1: group['incidenceAngle'][r0:r1, x0:x1], [y0, y1, x0, x1],
+                                   row_bytes=8 * (x1 - x0), looks=looks)
+        if 'azimuthAngle' in group:
+            azimuth = process_strips(lambda r0, r1: group['azimuthAngle'][r0:r1, x0:x1], [y0, y1, x0, x1],
+                                     row_bytes=8 * (x1 - x0), looks=looks)
+        else:
+            azimuth = -1 * (180 + float(f.attrs['HEADING']) + 90)
+            azimuth = np.full(incidence.shape, azimuth - np.round(azimuth / 360.) * 360., dtype=np.float32)
+    return incidence, azimuth
+
+def mask_data(data, coherence, mask_vmin):
+    ''' set pixels with coherence below mask_vmin to NaN '''
+    data = np.array(data, dtype=np.float32)
+    data[coherence < mask_vmin] = np.nan
+    return data
+
+def lalo2yx(atr, lat, lon):
+    ''' row and column of lat/lon in a geocoded file '''
+    y = int(np.floor((lat - float(atr['Y_FIRST'])) / float(atr['Y_STEP']) + 0.01))
+    x = int(np.floor((lon - float(atr['X_FIRST'])) / float(atr['X_STEP']) + 0.01))
+    return y, x
+
+def reference_data(data, atr, reference_lalo, ref_value=None):
+    ''' subtract the value at reference_lalo=[lat, lon] and update the REF_* attributes.
+    ref_value needs to be given if the reference point is outside of the (windowed) data. '''
+    y, x = lalo2yx(atr, reference_lalo[0], reference_lalo[1])
+    if ref_value is None:
+        if not (0 <= y < data.shape[0] and 0 <= x < data.shape[1]):
+            raise Exception('USER ERROR: reference point outside of data coverage: ' + str(reference_lalo))
+        ref_value = data[y, x]
+    if np.isnan(ref_value):
+        raise Exception('USER ERROR: reference point is masked or has no data: ' + str(reference_lalo))
+    data = data - ref_value
+    atr = dict(atr)
+    atr['REF_LAT'] = str(reference_lalo[0])
+    atr['REF_LON'] = str(reference_lalo[1])
+    atr['REF_Y'] = str(y)
+    atr['REF_X'] = str(x)
+    return data, atr
+
+def get_window(atr, plot_box, margin=10):
+    ''' row and column ranges [y0, y1, x0, x1] covering plot_box=[lat_min, lat_max, lon_min, lon_max] plus margin pixels '''
+    length = int(atr.get('LENGTH', atr.get('FILE_LENGTH')))
+    width = int(atr['WIDTH'])
+    if not plot_box:
+        return [0, length, 0, width]
+    ya, xa = lalo2yx(atr, plot_box[0], plot_box[2])
+    yb, xb = lalo2yx(atr, plot_box[1], plot_box[3])
+    y0 = max(0, min(ya, yb) - margin)
+    y1 = min(length, max(ya, yb) + 1 + margin)
+    x0 = max(0, min(xa, xb) - margin)
+    x1 = min(width, max(xa, xb) + 1 + margin)
+    if y0 >= y1 or x0 >= x1:
+        raise Exception('USER ERROR: plot_box outside of data coverage: ' + str(plot_box))
+    return [y0, y1, x0, x1]
+
+def get_point_window(atr, lalo):
+    ''' window of the single pixel at lalo=[lat, lon] '''
+    return get_window(atr, [lalo[0], lalo[0], lalo[1], lalo[1]], margin=0)
+
+def crop_attributes(atr, window):
+    ''' attributes of the window=[y0, y1, x0, x1] subset '''
+    atr = dict(atr)
+    y0, y1, x0, x1 = window
+    atr['Y_FIRST'] = str(float(atr['Y_FIRST']) + y0 * float(atr['Y_STEP']))
+    atr['X_FIRST'] = str(float(atr['X_FIRST']) + x0 * float(atr['X_STEP']))
+    atr['LENGTH'] = str(y1 - y0)
+    atr['FILE_LENGTH'] = str(y1 - y0)
+    atr['WIDTH'] = str(x1 - x0)
+    if 'REF_Y' in atr:
+        atr['REF_Y'] = str(int(atr['REF_Y']) - y0)
+        atr['REF_X'] = str(int(atr['REF_X']) - x0)
+    return atr
+
+def snap_window(window, looks, scene_window):
+    ''' window=[y0, y1, x0, x1] extended to multiples of looks (the blocks of a multilooked product of scene_window) '''
+    y0, y1, x0, x1 = window
+    return [y0 // looks * looks, min(-(-y1 // looks) * looks, scene_window[1]),
+            x0 // looks * looks, min(-(-x1 // looks) * looks, scene_window[3])]
+
+def get_product_box(window, looks=1):
+    ''' rows and columns of window=[y0, y1, x0, x1] (full resolution, see snap_window) in a product multilooked by looks '''
+    y0, y1, x0, x1 = window
+    return [y0 // looks, -(-y1 // looks), x0 // looks, -(-x1 // looks)]
+
+def crop_product(data, atr, window, looks=1):
+    ''' window=[y0, y1, x0, x1] (full resolution, see snap_window) of a product of the whole scene multilooked by looks '''
+    box = get_product_box(window, looks)
+    return data[box[0]:box[1], box[2]:box[3]], crop_attributes(atr, box)
+
+def read_attributes(fname):
+    ''' attributes of a HDF-EOS5 or MintPy file '''
+    if fname.endswith('.he5'):
+        with h5py.File(fname, 'r') as f:
+            atr = {key: value.decode('utf8') if isinstance(value, bytes) else str(value) for key, value in f.attrs.items()}
+    else:
+        from mintpy.utils import readfile
+        atr = readfile.read_attribute(fname)
+    atr['FILE_LENGTH'] = atr.get('FILE_LENGTH', atr['LENGTH'])
+    return atr
+
+def read_window(fname, dset_name=None, window=None, looks=1):
+    ''' read only the window=[y0, y1, x0, x1] hyperslab of a 2D dataset, in strips within the --max-memory budget,
+    multilooked by looks '''
+    from mintpy.utils import readfile
+    atr = read_attributes(fname)
+    if window is None:
+        window = get_window(atr, None)
+
+    def read_strip(r0, r1):
+        data, q = readfile.read(fname, datasetName=dset_name, box=(window[2], r0, window[3], r1))
+        return data
+
+    data = process_strips(read_strip, window, row_bytes=8 * (window[3] - window[2]), looks=looks)
+    return data, multilook_attributes(crop_attributes(atr, window), looks)
+
+def read_product(fname, dset_name=None):
+    ''' read 2D product and attributes '''
+    from mintpy.utils import readfile
+    data, atr = readfile.read(fname, datasetName=dset_name)
+    atr['FILE_LENGTH'] = atr.get('FILE_LENGTH', atr['LENGTH'])
+    return data, atr
+
+def write_product(fname, data, atr, dset_name='velocity', overviews=True):
+    ''' write 2D product with attributes (only needed for --save-products, the cache and MintPy scripts)
+    and its overview sidecar '''
+    from mintpy.utils import writefile
+    if os.path.dirname(fname):
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+    writefile.write({dset_name: data}, out_file=fname, metadata=atr)
+    if overviews:
+        write_overviews(fname, data)
+    return fname
+
+def get_overview_file(fname):
+    ''' sidecar with the overview levels of a product (geo_velocity.h5: geo_velocity.ovr.h5) '''
+    return os.path.splitext(fname)[0] + '.ovr.h5'
+
+def get_overview_looks(shape, min_size=256):
+    ''' looks (2, 4, 8, ...) of the overview levels of a raster, down to min_size pixels '''
+    looks_list = []
+    looks = 2
+    while max(shape) > min_size * looks // 2:
+        looks_list.append(looks)
+        looks *= 2
+    return looks_list
+
+def write_overviews(fname, data, min_size=256):
+    ''' overview levels with 2, 4, 8, ... looks (NaN-aware mean) of the 2D product, down to min_size pixels '''
+    stat = os.stat(fname)
+    overview_file = get_overview_file(fname)
+    with h5py.File(overview_file + '.tmp', 'w') as f:
+        f.attrs['SOURCE_SIZE'] = stat.st_size
+        f.attrs['SOURCE_MTIME'] = stat.st_mtime_ns
+        for looks in get_overview_looks(data.shape, min_size):
+            f.create_dataset('looks' + str(looks), data=multilook(data, looks), compression='gzip', compression_opts=1)
+    os.replace(overview_file + '.tmp', overview_file)
+    return overview_file
+
+def read_overview(fname, looks, window=None):
+    ''' window=[y0, y1, x0, x1] (full resolution rows and columns) of the coarsest overview level with at most looks.
+    Returns data and the looks of the level, or None if there is no (up-to-date) overview with at least 2 looks. '''
+    overview_file = get_overview_file(fname)
+    if looks < 2 or not os.path.isfile(overview_file):
+        return None
+    stat = os.stat(fname)
+    with h5py.File(overview_file, 'r') as f:
+        if f.attrs['SOURCE_SIZE'] != stat.st_size or f.attrs['SOURCE_MTIME'] != stat.st_mtime_ns:
+            return None
+        levels = sorted(int(name[5:]) for name in f.keys() if int(name[5:]) <= looks)
+        if not levels:
+            return None
+        level = levels[-1]
+        dset = f['looks' + str(level)]
+        if window is None:
+            return dset[:], level
+        y0, y1, x0, x1 = window
+        return dset[y0 // level:-(-y1 // level), x0 // level:-(-x1 // level)], level
+
+def read_overview_window(fname, atr, box, max_looks):
+    ''' box=[y0, y1, x0, x1] of the product fname (attributes atr) from the coarsest overview level with at most
+    max_looks. Returns data and attributes, or None if there is no such level '''
+    overview = read_overview(fname, max_looks, box)
+    if overview is None:
+        return None
+    data, level = overview
+    length, width = int(atr.get('LENGTH', atr.get('FILE_LENGTH'))), int(atr['WIDTH'])
+    y0, y1, x0, x1 = box
+    block = [y0 // level * level, min(-(-y1 // level) * level, length), x0 // level * level, min(-(-x1 // level) * level, width)]
+    return data, multilook_attributes(crop_attributes(atr, block), level)
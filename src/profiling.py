@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+# Stage instrumentation for --profile: wall time, CPU time, peak RSS and bytes read/written per stage,
+# written as Chrome trace (chrome://tracing, Perfetto) and printed as summary table.
+# When profiling is not enabled the stage context manager and decorator only check a flag.
+# Stages of worker processes (run_profiled) are returned with their results and merged with add_events.
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+
+enabled = False
+events = []                         # completed stages of this process
+start_time = time.perf_counter()
+start_epoch = time.time()           # start_time as time.time(), to align the stages of worker processes
+lock = threading.Lock()
+
+def enable(epoch=None):
+    ''' enable profiling, stage start times are relative to epoch (Default: now; for workers: start_epoch of the parent) '''
+    global enabled, start_time, start_epoch
+    enabled = True
+    start_time = time.perf_counter()
+    start_epoch = time.time()
+    if epoch is not None:
+        start_time -= start_epoch - epoch
+        start_epoch = epoch
+    events.clear()
+
+def get_peak_rss():
+    ''' peak resident set size of the process in bytes '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024       # kilobytes on Linux
+
+def get_io_bytes():
+    ''' bytes read and written by the process (Linux /proc/self/io, including page cache reads), or None '''
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+class Stage:
+    """ Context manager recording one stage """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.io = get_io_bytes()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        io = get_io_bytes()
+        event = {'name': self.name, 'start': self.wall - start_time, 'wall': wall - self.wall, 'cpu': cpu - self.cpu,
+                 'peak_rss': get_peak_rss(), 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if self.io and io:
+            event['read'] = io[0] - self.io[0]
+            event['written'] = io[1] - self.io[1]
+        with lock:
+            events.append(event)
+        return False
+
+def stage(name):
+    ''' context manager recording the stage name if profiling is enabled '''
+    if not enabled:
+        return contextlib.nullcontext()
+    return Stage(name)
+
+def profile_stage(name):
+    ''' decorator recording every call of a function as stage name '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_profiled(epoch, function, *args):
+    ''' call function in a worker process with profiling enabled (epoch: start_epoch of the parent).
+    Returns the result and the stages of the call '''
+    enable(epoch)
+    result = function(*args)
+    return result, list(events)
+
+def add_events(worker_events):
+    ''' add stages of a worker process (returned by run_profiled) '''
+    with lock:
+        events.extend(worker_events)
+
+def write_trace(fname):
+    ''' write the stages in Chrome trace event format (one process row per worker process) '''
+    trace_events = []
+    for event in events:
+        args = {'cpu_s': round(event['cpu'], 4), 'peak_rss_MB': round(event['peak_rss'] / 1024**2, 1) if event['peak_rss'] else None}
+        if 'read' in event:
+            args['read_MB'] = round(event['read'] / 1024**2, 2)
+            args['written_MB'] = round(event['written'] / 1024**2, 2)
+        trace_events.append({'name': event['name'], 'ph': 'X', 'ts': round(event['start'] * 1e6), 'dur': round(event['wall'] * 1e6),
+                             'pid': event['pid'], 'tid': event['tid'], 'args': args})
+    with open(fname, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+    print('profile: trace written to', fname)
+
+def print_summary():
+    ''' table of the stages (calls, wall and CPU time, peak RSS, bytes read and written) '''
+    stages = {}
+    for event in events:
+        summary = stages.setdefault(event['name'], {'calls': 0, 'wall': 0., 'cpu': 0., 'peak_rss': 0, 'read': 0, 'written': 0})
+        summary['calls'] += 1
+        summary['wall'] += event['wall']
+        summary['cpu'] += event['cpu']
+        summary['peak_rss'] = max(summary['peak_rss'], event['peak_rss'] or 0)
+        summary['read'] += event.get('read', 0)
+        summary['written'] += event.get('written', 0)
+    print(f"{'stage':32s} {'calls':>5s} {'wall s':>8s} {'cpu s':>8s} {'peak RSS MB':>11s} {'read MB':>9s} {'written MB':>10s}")
+    for name, summary in sorted(stages.items(), key=lambda item: -item[1]['wall']):
+        print(f"{name:32s} {summary['calls']:5d} {summary['wall']:8.3f} {summary['cpu']:8.3f} {summary['peak_rss'] / 1024**2:11.1f} "
+              f"{summary['read'] / 1024**2:9.2f} {summary['written'] / 1024**2:10.2f}")
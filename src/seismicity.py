@@ -1,37 +1,70 @@
-import requests
+import os
+import numpy as np
 from datetime import datetime, timezone
-import pandas as pd
+from helper_functions import get_cache_dir
+from earthquake_store import open_store, get_uncovered_intervals, add_events, query_events
+from profiling import stage, profile_stage
 
-def get_earthquakes(start_date, end_date, plot_box, depth_range="0 10", mag_range="0 10"):
-    # Define the API endpoint and parameters
-    url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+FDSN_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+
+@profile_stage('get_earthquakes')
+def get_earthquakes(start_date, end_date, plot_box, depth_range="0 10", mag_range=None, url=None, offline=False):
+    # Get events from the local store, download only the time intervals not yet in the store
+    # (url: FDSN event service, Default: $PLOTDATA_FDSN_URL or USGS)
+    if url is None:
+        url = os.getenv('PLOTDATA_FDSN_URL', FDSN_URL)
     
     depth_max, depth_min = map(lambda x: -float(x), depth_range.split())
+    depth_limits = [depth_min, depth_max]
+    mag_limits = [float(val) for val in mag_range.split()] if mag_range else None
     
+    # Calculate the Unix timestamp in milliseconds of start and end time
+    min_time = int(datetime.strptime(start_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    max_time = int(datetime.strptime(end_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    con = open_store(get_cache_dir('seismicity') + '/events.sqlite')
+    intervals = get_uncovered_intervals(con, plot_box, depth_limits, min_time, max_time)
+    if intervals and offline:
+        print('get_earthquakes: offline, catalog not complete for requested period and area')
+    elif intervals:
+        for interval in intervals:
+            earthquake_data = download_earthquakes(url, interval[0], interval[1], plot_box, depth_limits)
+            add_events(con, earthquake_data, plot_box, depth_limits, interval[0], interval[1])
+    with stage('query_events'):
+        earthquake_data = query_events(con, plot_box, depth_limits, min_time, max_time, mag_limits)
+    con.close()
+    
+    # Create a DataFrame from the earthquake data
+    import pandas as pd
+    columns = ["Time", "Latitude", "Longitude", "Depth", "Magnitude"]
+    events_df = pd.DataFrame(earthquake_data, columns=columns)
+    return events_df
+
+@profile_stage('download_earthquakes')
+def download_earthquakes(url, start_time, end_time, plot_box, depth_limits):
+    # Define the API parameters (times in milliseconds)
     params = {
        "format": "geojson",
-       "starttime": start_date[:4] + "-" + start_date[4:6] + "-" + start_date[6:],
-       "endtime": end_date[:4] + "-" + end_date[4:6] + "-" + end_date[6:],
+       "starttime": datetime.fromtimestamp(start_time / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+       "endtime": datetime.fromtimestamp(end_time / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
        "minlatitude": plot_box[0],
        "maxlatitude": plot_box[1],
        "minlongitude": plot_box[2],
        "maxlongitude": plot_box[3],
-       "mindepth": depth_min,   # Minimum depth (in kilometers)
-       "maxdepth": depth_max,   # Maximum depth (in kilometers)
+       "mindepth": depth_limits[0],   # Minimum depth (in kilometers)
+       "maxdepth": depth_limits[1],   # Maximum depth (in kilometers)
     }
     
     # Make a request to the USGS API
+    import requests
     response = requests.get(url, params=params)
+    response.raise_for_status()
     data = response.json()
     
     # Extract earthquake information from the API response
     earthquakes = data["features"]
     earthquake_data = []
 
-    # Calculate the Unix timestamp in milliseconds of start and end time
-    min_time = int(datetime.strptime(start_date, "%Y%m%d").timestamp() * 1000)
-    max_time = int(datetime.strptime(end_date, "%Y%m%d").timestamp() * 1000)
-
     for quake in earthquakes:
         magnitude = quake["properties"]["mag"]
         latitude = quake["geometry"]["coordinates"][1]
@@ -39,16 +72,12 @@ def get_earthquakes(start_date, end_date, plot_box, depth_range="0 10", mag_rang
         depth = quake["geometry"]["coordinates"][2]
         time = quake["properties"]["time"]
         
-        earthquake_data.append([time,latitude, longitude, depth, magnitude])
-    
-    # Create a DataFrame from the earthquake data
-    columns = ["Time", "Latitude", "Longitude", "Depth", "Magnitude"]
-    events_df = pd.DataFrame(earthquake_data, columns=columns)
-    return events_df
+        earthquake_data.append([quake["id"], time, latitude, longitude, depth, magnitude])
+    return earthquake_data
 
 def normalize_earthquake_times(events_df, start_date, end_date):
 # Normalize times for colormap (use the Unix timestamp in milliseconds)
     min_time = int(datetime.strptime(start_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
     max_time = int(datetime.strptime(end_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
-    norm_times = [(time - min_time) / (max_time - min_time) for time in events_df["Time"]]
-    return norm_times
\ No newline at end of file
+    norm_times = (np.asarray(events_df["Time"], dtype=np.float64) - min_time) / (max_time - min_time)
+    return norm_times
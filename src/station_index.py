@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+# Spatial index of a GPS station list (grid of cell_size degrees) for box, radius and nearest-station queries
+import os
+import csv
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+station_indexes = {}                # indexes loaded in this process
+
+def get_station_index(gps_list_file):
+    ''' StationIndex of the station list file (loaded again only if the file changed) '''
+    mtime = os.stat(gps_list_file).st_mtime_ns
+    if gps_list_file not in station_indexes or station_indexes[gps_list_file][0] != mtime:
+        with open(gps_list_file) as inf:
+            next(inf)
+            rows = [row for row in csv.reader(inf, delimiter=' ') if len(row) >= 3]
+        names = [row[0] for row in rows]
+        lats = [float(row[1]) for row in rows]
+        lons = [float(row[2]) for row in rows]
+        station_indexes[gps_list_file] = (mtime, StationIndex(names, lats, lons))
+    return station_indexes[gps_list_file][1]
+
+def get_distance(lat1, lon1, lat2, lon2):
+    ''' great circle distance in km '''
+    lat1, lon1, lat2, lon2 = map(np.deg2rad, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class StationIndex:
+    """ Station names and coordinates as arrays, with a grid index for spatial queries """
+
+    def __init__(self, names, lats, lons, cell_size=0.5):
+        self.names = np.array(names, dtype=str)
+        self.lats = np.array(lats, dtype=np.float64)
+        self.lons = np.array(lons, dtype=np.float64)
+        self.cell_size = cell_size
+        self.cells = {}
+        rows = np.floor(self.lats / cell_size).astype(np.int64)
+        cols = np.floor(self.lons / cell_size).astype(np.int64)
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            self.cells.setdefault(cell, []).append(i)
+        self.cells = {cell: np.array(indices) for cell, indices in self.cells.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _candidates(self, plot_box):
+        ''' indices of stations in grid cells overlapping plot_box=[lat_min, lat_max, lon_min, lon_max] '''
+        row0, row1 = int(np.floor(plot_box[0] / self.cell_size)), int(np.floor(plot_box[1] / self.cell_size))
+        col0, col1 = int(np.floor(plot_box[2] / self.cell_size)), int(np.floor(plot_box[3] / self.cell_size))
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            cells = [cell for cell in self.cells if row0 <= cell[0] <= row1 and col0 <= cell[1] <= col1]
+        else:
+            cells = [(row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1) if (row, col) in self.cells]
+        if not cells:
+            return np.array([], dtype=np.int64)
+        return np.concatenate([self.cells[cell] for cell in cells])
+
+    def in_box(self, plot_box):
+        ''' indices (in list order) of stations inside plot_box=[lat_min, lat_max, lon_min, lon_max] '''
+        idx = self._candidates(plot_box)
+        inside = (self.lats[idx] >= plot_box[0]) & (self.lats[idx] <= plot_box[1]) & \
+                 (self.lons[idx] >= plot_box[2]) & (self.lons[idx] <= plot_box[3])
+        return np.sort(idx[inside])
+
+    def in_radius(self, lat, lon, radius_km):
+        ''' indices of stations within radius_km of lat/lon, sorted by distance '''
+        dlat = np.rad2deg(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(np.cos(np.deg2rad(lat)), 1e-6)
+        idx = self._candidates([lat - dlat, lat + dlat, lon - dlon, lon + dlon])
+        distance = get_distance(lat, lon, self.lats[idx], self.lons[idx])
+        order = np.argsort(distance)
+        return idx[order][distance[order] <= radius_km]
+
+    def nearest(self, lat, lon, k=1):
+        ''' indices of the k stations nearest to lat/lon, sorted by distance '''
+        k = min(k, len(self))
+        radius_km = self.cell_size * 111.0
+        while True:
+            idx = self.in_radius(lat, lon, radius_km)
+            if len(idx) >= k or radius_km > np.pi * EARTH_RADIUS_KM:
+                return idx[:k]
+            radius_km *= 2
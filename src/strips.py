@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+# Out-of-core processing in strips of rows for --max-memory: rasters are read, processed and
+# multilooked strip by strip so that the memory use is bounded by the budget, not the scene size.
+# Without a budget the callers' default block sizes are used and nothing is multilooked.
+import numpy as np
+
+max_memory = None                   # memory budget in bytes, None: no limit
+OUTPUT_FRACTION = 0.25              # part of the budget for the (multilooked) output arrays
+
+def set_max_memory(max_memory_gb):
+    ''' set the budget in GB (None or 0: no limit) '''
+    global max_memory
+    max_memory = max_memory_gb * 1024**3 if max_memory_gb else None
+
+def get_strip_rows(row_bytes, length, default_rows=None, looks=1):
+    ''' rows per strip (multiple of looks) so that strips with row_bytes per row fit into the budget '''
+    if max_memory is None:
+        rows = default_rows or length
+    else:
+        rows = int(max_memory * (1 - OUTPUT_FRACTION) // max(row_bytes, 1))
+    rows = max(looks, rows // looks * looks)
+    return min(rows, length)
+
+def get_looks(length, width, pixel_bytes=4, num_arrays=1):
+    ''' multilook factor so that num_arrays outputs of the (length, width) window fit into the output part of the budget '''
+    if max_memory is None:
+        return 1
+    looks = 1
+    while num_arrays * pixel_bytes * -(-length // looks) * -(-width // looks) > max_memory * OUTPUT_FRACTION:
+        looks += 1
+    if looks > 1:
+        print(f'--max-memory: {length} x {width} pixels displayed with {looks} x {looks} looks')
+    return looks
+
+def multilook(data, looks):
+    ''' mean of looks x looks blocks ignoring NaN (blocks at the lower and right edge may be partial) '''
+    if looks == 1:
+        return data
+    length, width = data.shape
+    out_length, out_width = -(-length // looks), -(-width // looks)
+    data = np.pad(data.astype(np.float32), ((0, out_length * looks - length), (0, out_width * looks - width)), constant_values=np.nan)
+    blocks = data.reshape(out_length, looks, out_width, looks)
+    count = np.sum(~np.isnan(blocks), axis=(1, 3))
+    total = np.nansum(blocks, axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan).astype(np.float32)
+
+def multilook_attributes(atr, looks):
+    ''' attributes of the multilooked data '''
+    if looks == 1:
+        return atr
+    atr = dict(atr)
+    length = -(-int(atr.get('LENGTH', atr.get('FILE_LENGTH'))) // looks)
+    atr['LENGTH'] = str(length)
+    atr['FILE_LENGTH'] = str(length)
+    atr['WIDTH'] = str(-(-int(atr['WIDTH']) // looks))
+    atr['Y_STEP'] = str(float(atr['Y_STEP']) * looks)
+    atr['X_STEP'] = str(float(atr['X_STEP']) * looks)
+    for key in ['REF_Y', 'REF_X']:
+        if key in atr:
+            atr[key] = str(int(atr[key]) // looks)
+    return atr
+
+def process_strips(process_strip, window, row_bytes, default_rows=None, looks=1):
+    ''' run process_strip(r0, r1) for strips of the rows of window=[y0, y1, x0, x1] and return the multilooked results as one array.
+    row_bytes: memory used by process_strip per row '''
+    y0, y1, x0, x1 = window
+    strip_rows = get_strip_rows(row_bytes, y1 - y0, default_rows, looks)
+    out = np.empty((-(-(y1 - y0) // looks), -(-(x1 - x0) // looks)), dtype=np.float32)
+    for r0 in range(y0, y1, strip_rows):
+        r1 = min(r0 + strip_rows, y1)
+        out[(r0 - y0) // looks:-(-(r1 - y0) // looks)] = multilook(process_strip(r0, r1), looks)
+    return out
+
+def get_display_looks_for_size(atr, plot_box, num_rows, num_columns):
+    ''' multilook factor so that the raster has about as many pixels across plot_box as num_rows x num_columns '''
+    length, width = int(atr.get('LENGTH', atr.get('FILE_LENGTH'))), int(atr['WIDTH'])
+    if plot_box:
+        length = min(length, abs(plot_box[1] - plot_box[0]) / abs(float(atr['Y_STEP'])))
+        width = min(width, abs(plot_box[3] - plot_box[2]) / abs(float(atr['X_STEP'])))
+    return max(1, int(max(length / num_rows, width / num_columns)))  # equal aspect: the raster fits into the axis
@@ -0,0 +1,305 @@
+#! /usr/bin/env python3
+# Local XYZ map-tile server over prepared products (plot_data.py serve): /tiles/{product}/{z}/{x}/{y}.png
+# Tiles are rendered on demand from windowed reads (jet colormap, unit and vlim as view.py) or from the
+# hillshade pyramid of the DEM, and kept in an in-memory plus on-disk LRU cache.
+import os
+import io
+import re
+import json
+import glob
+import hashlib
+import argparse
+import threading
+import numpy as np
+import h5py
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from helper_functions import get_cache_dir, get_file_names, prepend_scratchdir_if_needed, get_dem_extent
+from products import read_attributes, read_overview
+
+EXAMPLE = """example:
+  plot_data.py serve MaunaLoaSenDT87/mintpy_5_20 $SCRATCHDIR/MaunaLoa/up.h5 $SCRATCHDIR/MaunaLoa/hz.h5 --dem-file $SCRATCHDIR/MaunaLoa/MLtry/data/demGeo.h5
+  plot_data.py serve $SCRATCHDIR/MaunaLoa/SenDT87/geo_velocity.h5 --vlim -5 5 --unit cm --port 8080
+
+Products are given as files (geo_velocity.h5, up.h5, hz.h5) or data directories (prepared geo_velocity.h5).
+Products are written with --save-products, up.h5 and hz.h5 into the project directory ($SCRATCHDIR/MaunaLoa).
+Open http://localhost:PORT/ for a map, tiles are /tiles/{product}/{z}/{x}/{y}.png
+"""
+
+TILE_SIZE = 256
+TILE_URL = re.compile(r'^/tiles/([^/]+)/(\d+)/(\d+)/(\d+)\.png$')
+
+INDEX_HTML = """<!DOCTYPE html>
+<html><head><title>PlotData</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {height: 100%; margin: 0;}</style></head>
+<body><div id="map"></div><script>
+fetch('/products.json').then(r => r.json()).then(products => {
+  var map = L.map('map');
+  var layers = {};
+  for (const [name, product] of Object.entries(products)) {
+    layers[name] = L.tileLayer('/tiles/' + name + '/{z}/{x}/{y}.png', {maxZoom: 18, opacity: 0.8});
+  }
+  var names = Object.keys(products);
+  layers[names[0]].addTo(map);
+  L.control.layers(layers).addTo(map);
+  var box = products[names[0]].plot_box;
+  map.fitBounds([[box[0], box[2]], [box[1], box[3]]]);
+});
+</script></body></html>
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='plot_data.py serve', description='XYZ map-tile server over prepared products',
+                                     epilog=EXAMPLE, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('products', nargs='*', help='product files or data directories')
+    parser.add_argument('--dem-file', dest='dem_file', default=None, help='DEM for the shaded-relief product')
+    parser.add_argument('--unit', dest='unit', default='cm', help='InSAR units (Default: cm)')
+    parser.add_argument('--vlim', dest='vlim', nargs=2, metavar=('VMIN', 'VMAX'), type=float, help='colorlimit (Default: data range)')
+    parser.add_argument('--port', dest='port', default=8000, type=int, help='port (Default: 8000)')
+    parser.add_argument('--memory-tiles', dest='memory_tiles', default=4096, type=int, help='tiles kept in memory (Default: 4096)')
+    parser.add_argument('--cache-size', dest='cache_size', default=1.0, type=float, help='size limit of the on-disk tile cache in GB (Default: 1)')
+    return parser
+
+def get_tile_coordinates(z, x, y):
+    ''' latitudes and longitudes of the pixel centers of web-mercator tile z/x/y '''
+    num_tiles = 2**z
+    pixels = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lon = (x + pixels) / num_tiles * 360 - 180
+    lat = np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixels) / num_tiles))))
+    return lat, lon
+
+def get_dataset_name(fname):
+    ''' name of the 2D dataset of a MintPy product file '''
+    with h5py.File(fname, 'r') as f:
+        names = [name for name in f.keys() if isinstance(f[name], h5py.Dataset) and f[name].ndim == 2]
+        file_type = f.attrs.get('FILE_TYPE')
+    if isinstance(file_type, bytes):
+        file_type = file_type.decode('utf8')
+    if file_type in names or not names:
+        return file_type
+    return names[0]
+
+def get_products(files, dem_file=None):
+    ''' dict of products by name: files given as product files or data directories '''
+    products = {}
+    for file in files:
+        if not os.path.isfile(file):
+            file = get_file_names(prepend_scratchdir_if_needed(file))[4]
+            if not os.path.isabs(file):
+                # prepared products are written relative to $SCRATCHDIR (e.g. MaunaLoa/SenDT87/geo_velocity.h5)
+                file = os.getenv('SCRATCHDIR') + '/' + file
+            if not os.path.isfile(file):
+                raise Exception('USER ERROR: no prepared product (run with --save-products): ' + file)
+        file = os.path.abspath(file)
+        name = os.path.splitext(os.path.basename(file))[0]
+        if name in products:
+            name = os.path.basename(os.path.dirname(file)) + '_' + name
+        atr = read_attributes(file)
+        products[name] = {'type': 'insar', 'file': file, 'atr': atr, 'dset_name': get_dataset_name(file)}
+    if dem_file:
+        dem_file = os.path.abspath(dem_file)
+        products['shaded-relief'] = {'type': 'shaded-relief', 'file': dem_file, 'atr': read_attributes(dem_file)}
+    for product in products.values():
+        left, right, bottom, top = get_dem_extent(product['atr'])
+        product['plot_box'] = [min(bottom, top), max(bottom, top), min(left, right), max(left, right)]
+    return products
+
+def get_sample_indices(lat, lon, y_first, y_step, x_first, x_step, length, width):
+    ''' row and column of the pixel centers in a raster, -1 outside '''
+    rows = np.floor((lat - y_first) / y_step).astype(np.int64)
+    cols = np.floor((lon - x_first) / x_step).astype(np.int64)
+    rows[(rows < 0) | (rows >= length)] = -1
+    cols[(cols < 0) | (cols >= width)] = -1
+    return rows, cols
+
+class TileRenderer:
+    """ Renders tiles of the products and keeps them in an in-memory and on-disk LRU cache """
+
+    def __init__(self, products, unit='cm', vlim=None, memory_tiles=4096, cache_size_gb=1.0):
+        import matplotlib
+        self.products = products
+        self.unit = unit
+        self.cmap = matplotlib.colormaps['jet']
+        self.memory_tiles = memory_tiles
+        self.cache_size = cache_size_gb * 1024**3
+        self.memory_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.cache_dir = get_cache_dir('tiles')
+        for name, product in products.items():
+            stat = os.stat(product['file'])
+            key = [product['file'], stat.st_size, stat.st_mtime_ns, unit, vlim]
+            product['key'] = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:16]
+            if product['type'] == 'insar':
+                product['vlim'] = self.get_vlim(product, vlim)
+        self.disk_size = sum(os.path.getsize(file) for file in glob.glob(self.cache_dir + '/*/*.png'))
+
+    def get_vlim(self, product, vlim):
+        ''' color limits of a product: vlim or range of the whole product (same for all tiles) '''
+        from plot_functions import scale_to_unit
+        with h5py.File(product['file'], 'r') as f:
+            dset = f[product['dset_name']]
+            step = max(1, max(dset.shape) // 2048)
+            data = dset[::step, ::step]
+        data, vmin, vmax, label = scale_to_unit(data, product['atr'], self.unit, vlim)
+        if vmax == vmin or not np.isfinite(vmax - vmin):
+            # constant (or empty) product or a single-value --vlim: widen the range so that the normalisation is defined
+            center = vmin if np.isfinite(vmin) else 0.
+            epsilon = max(abs(center) * 1e-3, 1e-6)
+            vmin, vmax = center - epsilon, center + epsilon
+        print('tile server:', os.path.basename(product['file']), f'color limits {vmin:.2f} {vmax:.2f} {label}')
+        return [vmin, vmax]
+
+    def get_tile(self, name, z, x, y):
+        ''' PNG of tile z/x/y of product name '''
+        product = self.products[name]
+        tile_key = f"{product['key']}/{z}_{x}_{y}.png"
+        with self.lock:
+            if tile_key in self.memory_cache:
+                self.memory_cache.move_to_end(tile_key)
+                return self.memory_cache[tile_key]
+        tile_file = self.cache_dir + '/' + tile_key
+        if os.path.isfile(tile_file):
+            os.utime(tile_file)
+            with open(tile_file, 'rb') as f:
+                png = f.read()
+        else:
+            if product['type'] == 'insar':
+                rgba = self.render_insar(product, z, x, y)
+            else:
+                rgba = self.render_shaded_relief(product, z, x, y)
+            png = encode_png(rgba)
+            self.store_tile(tile_file, png)
+        with self.lock:
+            self.memory_cache[tile_key] = png
+            if len(self.memory_cache) > self.memory_tiles:
+                self.memory_cache.popitem(last=False)
+        return png
+
+    def render_insar(self, product, z, x, y):
+        ''' RGBA tile of a velocity product: windowed read, for zoomed-out tiles from the overview sidecar
+        (or strided), nearest sampling '''
+        from plot_functions import scale_to_unit
+        atr = product['atr']
+        lat, lon = get_tile_coordinates(z, x, y)
+        rows, cols = get_sample_indices(lat, lon, float(atr['Y_FIRST']), float(atr['Y_STEP']), float(atr['X_FIRST']),
+                                        float(atr['X_STEP']), int(atr['FILE_LENGTH']), int(atr['WIDTH']))
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        if np.all(rows < 0) or np.all(cols < 0):
+            return rgba
+        y0, y1 = rows[rows >= 0].min(), rows[rows >= 0].max() + 1
+        x0, x1 = cols[cols >= 0].min(), cols[cols >= 0].max() + 1
+        step = max(1, min((y1 - y0) // TILE_SIZE, (x1 - x0) // TILE_SIZE))
+        overview = read_overview(product['file'], step, [y0, y1, x0, x1])
+        if overview:
+            data, step = overview
+            y0, x0 = y0 // step * step, x0 // step * step
+        else:
+            with h5py.File(product['file'], 'r') as f:
+                data = f[product['dset_name']][y0:y1:step, x0:x1:step]
+        data, vmin, vmax, label = scale_to_unit(data, atr, self.unit, product['vlim'])
+        data = data[np.maximum(rows - y0, 0) // step][:, np.maximum(cols - x0, 0) // step]
+        valid = (rows[:, np.newaxis] >= 0) & (cols[np.newaxis, :] >= 0) & ~np.isnan(data)
+        rgba[:] = self.cmap(np.clip((data - vmin) / (vmax - vmin), 0, 1), bytes=True)
+        rgba[~valid, 3] = 0
+        return rgba
+
+    def render_shaded_relief(self, product, z, x, y):
+        ''' RGBA tile from the level of the hillshade pyramid matching the tile resolution '''
+        from hillshade import read_hillshade
+        lat, lon = get_tile_coordinates(z, x, y)
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        plot_box = product['plot_box']
+        tile_box = [lat.min(), lat.max(), lon.min(), lon.max()]
+        if tile_box[0] > plot_box[1] or tile_box[1] < plot_box[0] or tile_box[2] > plot_box[3] or tile_box[3] < plot_box[2]:
+            return rgba
+        tile_box = [max(tile_box[0], plot_box[0]), min(tile_box[1], plot_box[1]), max(tile_box[2], plot_box[2]), min(tile_box[3], plot_box[3])]
+        rgb, extent = read_hillshade(product['file'], tile_box, num_pixels=TILE_SIZE)
+        left, right, bottom, top = extent
+        rows, cols = get_sample_indices(lat, lon, top, (bottom - top) / rgb.shape[0], left, (right - left) / rgb.shape[1],
+                                        rgb.shape[0], rgb.shape[1])
+        rgba[:, :, :3] = rgb[np.maximum(rows, 0)][:, np.maximum(cols, 0)]
+        rgba[:, :, 3] = 255
+        rgba[(rows[:, np.newaxis] < 0) | (cols[np.newaxis, :] < 0), 3] = 0
+        return rgba
+
+    def store_tile(self, tile_file, png):
+        ''' write tile to the disk cache, remove least recently used tiles if the cache is too large '''
+        os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+        tmp_file = tile_file + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_file, tile_file)
+        with self.lock:
+            self.disk_size += len(png)
+            if self.disk_size <= self.cache_size:
+                return
+            entries = []
+            for file in glob.glob(self.cache_dir + '/*/*.png'):
+                try:
+                    stat = os.stat(file)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file))
+            self.disk_size = sum(entry[1] for entry in entries)
+            for mtime, size, file in sorted(entries):
+                if self.disk_size <= 0.9 * self.cache_size:
+                    break
+                os.remove(file)
+                self.disk_size -= size
+
+def encode_png(rgba):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def create_handler(renderer):
+    ''' request handler serving the index page, products.json and tiles of renderer '''
+    products_json = json.dumps({name: {'type': product['type'], 'plot_box': product['plot_box']}
+                                for name, product in renderer.products.items()}).encode()
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = TILE_URL.match(self.path)
+            if self.path == '/':
+                self.send_content(INDEX_HTML.encode(), 'text/html')
+            elif self.path == '/products.json':
+                self.send_content(products_json, 'application/json')
+            elif match and match.group(1) in renderer.products:
+                z, x, y = int(match.group(2)), int(match.group(3)), int(match.group(4))
+                if not (0 <= x < 2**z and 0 <= y < 2**z):
+                    self.send_error(404, 'tile outside of the map')
+                    return
+                self.send_content(renderer.get_tile(match.group(1), z, x, y), 'image/png')
+            else:
+                self.send_error(404)
+
+        def send_content(self, content, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.send_header('Cache-Control', 'max-age=3600')
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+def main(iargs):
+    inps = create_parser().parse_args(args=iargs)
+    if inps.dem_file:
+        inps.dem_file = os.path.expandvars(inps.dem_file)
+    if not inps.products and not inps.dem_file:
+        raise Exception('USER ERROR: no products given')
+    products = get_products(inps.products, inps.dem_file)
+    renderer = TileRenderer(products, inps.unit, inps.vlim, inps.memory_tiles, inps.cache_size)
+    server = ThreadingHTTPServer(('localhost', inps.port), create_handler(renderer))
+    print('tile server: products', ', '.join(products), f'on http://localhost:{inps.port}/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+# In-process velocity estimation from MintPy HDF-EOS5 (*.he5) or timeseries (*.h5) files
+import numpy as np
+import h5py
+from datetime import datetime
+from products import crop_attributes, EOS_COHERENCE_DSET
+from strips import process_strips, multilook_attributes
+
+EOS_TIMESERIES_DSET = 'HDFEOS/GRIDS/timeseries/observation/displacement'
+EOS_DATE_DSET = 'HDFEOS/GRIDS/timeseries/observation/date'
+
+def get_timeseries_dataset_names(f):
+    ''' names of the displacement and date datasets for HDF-EOS5 and MintPy timeseries files '''
+    if EOS_TIMESERIES_DSET in f:
+        return EOS_TIMESERIES_DSET, EOS_DATE_DSET
+    return 'timeseries', 'date'
+
+def read_attributes(f):
+    ''' root attributes of an open h5py file as dict of strings '''
+    atr = {}
+    for key, value in f.attrs.items():
+        if isinstance(value, bytes):
+            value = value.decode('utf8')
+        atr[key] = str(value)
+    return atr
+
+def read_date_list(fname):
+    ''' date list (YYYYMMDD) of a HDF-EOS5 or timeseries file '''
+    with h5py.File(fname, 'r') as f:
+        ts_dset, date_dset = get_timeseries_dataset_names(f)
+        date_list = [date.decode('utf8') for date in f[date_dset][:]]
+    return date_list
+
+def date_list2years(date_list):
+    ''' time in years since the first date '''
+    dates = [datetime.strptime(date, '%Y%m%d') for date in date_list]
+    return np.array([(date - dates[0]).days / 365.25 for date in dates])
+
+def estimate_velocity(fname, start_date, end_date, window=None, max_block_size=2e8, mask_vmin=None, looks=1):
+    ''' Linear velocity (m/yr) of all pixels between start_date and end_date (YYYYMMDD, inclusive).
+    Only these dates and the window=[y0, y1, x0, x1] are read, in blocks of rows of at most max_block_size values
+    (or within the --max-memory budget). mask_vmin: mask pixels with lower temporal coherence (HDF-EOS5 files),
+    looks: multilook factor of the output. '''
+    with h5py.File(fname, 'r') as f:
+        ts_dset, date_dset = get_timeseries_dataset_names(f)
+        date_list = [date.decode('utf8') for date in f[date_dset][:]]
+        atr = read_attributes(f)
+        if start_date not in date_list or end_date not in date_list:
+            raise Exception('USER ERROR: dates not in ' + fname + ': ' + start_date + ' ' + end_date)
+        i0 = date_list.index(start_date)
+        i1 = date_list.index(end_date) + 1
+        if i1 - i0 < 2:
+            raise Exception('USER ERROR: need at least 2 dates for velocity estimation: ' + start_date + ' ' + end_date)
+
+        # design matrix for offset and velocity, solved for all pixels of a block at once
+        years = date_list2years(date_list[i0:i1])
+        G = np.ones((i1 - i0, 2), dtype=np.float64)
+        G[:, 1] = years
+        G_inv = np.linalg.pinv(G)[1, :]
+
+        dset = f[ts_dset]
+        y0, y1, x0, x1 = window if window else [0, dset.shape[1], 0, dset.shape[2]]
+        width = x1 - x0
+
+        def process_strip(r0, r1):
+            data = dset[i0:i1, r0:r1, x0:x1].reshape(i1 - i0, -1)
+            velocity = np.dot(G_inv, data).reshape(r1 - r0, width).astype(np.float32)
+            if mask_vmin is not None:
+                velocity[f[EOS_COHERENCE_DSET][r0:r1, x0:x1] < mask_vmin] = np.nan
+            return velocity
+
+        # float32 data plus their float64 copy in np.dot
+        velocity = process_strips(process_strip, [y0, y1, x0, x1], row_bytes=12 * (i1 - i0) * width,
+                                  default_rows=max(1, int(max_block_size / ((i1 - i0) * width))), looks=looks)
+
+    atr = multilook_attributes(crop_attributes(atr, [y0, y1, x0, x1]), looks)
+    atr['FILE_TYPE'] = 'velocity'
+    atr['UNIT'] = 'm/year'
+    atr['START_DATE'] = start_date
+    atr['END_DATE'] = end_date
+    atr['DATE12'] = start_date + '_' + end_date
+    atr['REF_DATE'] = start_date
+    return velocity, atr
+
+def sliding_window_velocity(fname, windows, window=None, reference_yx=None):
+    ''' Velocities (m/yr) for consecutive time windows [[start_date, end_date], ...] (YYYYMMDD, inclusive, increasing).
+    Running sums of the linear fit are updated only with the dates entering and leaving the window.
+    reference_yx: pixel (of the full file) subtracted from all dates. Yields start_date, end_date, velocity, atr '''
+    with h5py.File(fname, 'r') as f:
+        ts_dset, date_dset = get_timeseries_dataset_names(f)
+        date_list = [date.decode('utf8') for date in f[date_dset][:]]
+        years = date_list2years(date_list)
+        dset = f[ts_dset]
+        y0, y1, x0, x1 = window if window else [0, dset.shape[1], 0, dset.shape[2]]
+        atr = crop_attributes(read_attributes(f), [y0, y1, x0, x1])
+        atr['FILE_TYPE'] = 'velocity'
+        atr['UNIT'] = 'm/year'
+        if reference_yx:
+            ref_timeseries = dset[:, reference_yx[0], reference_yx[1]]
+
+        def read_date(i):
+            data = dset[i, y0:y1, x0:x1].astype(np.float64)
+            if reference_yx:
+                data -= ref_timeseries[i]
+            return data
+
+        # sums over the valid (not NaN) dates in the window per pixel: n, t, t^2, y, t*y (t relative to the first date)
+        t_list = np.array(years) - years[0]
+        shape = (y1 - y0, x1 - x0)
+        n, sum_t, sum_tt, sum_y, sum_ty = [np.zeros(shape) for i in range(5)]
+        date_numbers = np.array(date_list, dtype=np.int64)
+
+        def update(i, sign):
+            data = read_date(i)
+            valid = np.isfinite(data)
+            data = np.nan_to_num(data, nan=0., posinf=0., neginf=0.)
+            t = t_list[i]
+            n[:] += sign * valid
+            sum_t[:] += sign * t * valid
+            sum_tt[:] += sign * t**2 * valid
+            sum_y[:] += sign * data
+            sum_ty[:] += sign * t * data
+
+        i0 = i1 = 0
+        for start_date, end_date in windows:
+            j0 = int(np.searchsorted(date_numbers, int(start_date), side='left'))
+            j1 = int(np.searchsorted(date_numbers, int(end_date), side='right'))
+            j0 = min(j0, j1)
+            # drop dates leaving and add dates entering the window
+            drop = range(i0, min(i1, j0)) if j0 < i1 else range(i0, i1)
+            add = range(max(i1, j0), j1) if j0 < i1 else range(j0, j1)
+            for i in drop:
+                update(i, -1)
+            for i in add:
+                update(i, 1)
+            i0, i1 = j0, j1
+            num_dates = j1 - j0
+
+            if num_dates < 2:
+                print('sliding window: less than 2 dates between', start_date, end_date, '-- skipped')
+                continue
+            with np.errstate(invalid='ignore', divide='ignore'):
+                velocity = (n * sum_ty - sum_t * sum_y) / (n * sum_tt - sum_t**2)
+            velocity = np.where(n >= 2, velocity, np.nan).astype(np.float32)
+            frame_atr = dict(atr)
+            frame_atr['START_DATE'] = date_list[j0]
+            frame_atr['END_DATE'] = date_list[j1 - 1]
+            frame_atr['DATE12'] = date_list[j0] + '_' + date_list[j1 - 1]
+            yield date_list[j0], date_list[j1 - 1], velocity, frame_atr